@@ -0,0 +1,267 @@
+#! /usr/bin/env python
+"""Times each stage of loading and drawing SVGs, and writes the results as JSON.
+
+Usage:
+    python benchmark.py [options] [file.svg ...]
+
+With no files, every SVG in svgs/ is measured, along with synthetic documents
+of 1k, 10k, 100k and 1M path segments. For each document the stages are:
+
+    read         reading (and decompressing) the file
+    xml          parsing the XML
+    tokenize     scanning path data into commands
+    flatten      walking the document and flattening curves into lines
+    triangulate  triangulating fills and tesselating strokes
+    arrays       packing the paths into NumPy arrays
+    gradients    evaluating per-vertex gradient colours
+    upload       building the renderer, i.e. uploading to OpenGL
+    draw         drawing one frame, the median over --frames frames
+
+Each stage is run --repeat times and its best time reported, in seconds. The
+upload and draw stages need an OpenGL context, for which a hidden window is
+created. On machines without a display, run the benchmark under xvfb-run,
+where Mesa renders in software, or pass --headless to use the EGL headless
+mode of newer pyglet versions. If no context can be created these stages are
+reported as null, and the reason is recorded under "gl".
+
+Compare against earlier results with --compare, which lists every stage
+that became slower by more than --threshold and exits with status 1 if any
+did:
+
+    python benchmark.py --output before.json
+    python benchmark.py --compare before.json
+
+"""
+
+import gc
+import os
+import math
+import sys
+import json
+import time
+import random
+import tempfile
+import platform
+import subprocess
+from optparse import OptionParser
+
+import pyglet
+
+SIZES = (1000, 10000, 100000, 1000000)
+
+LOAD_STAGES = ('read', 'xml', 'tokenize', 'flatten', 'triangulate', 'arrays', 'gradients')
+
+#Path segments in each synthetic shape
+SEGMENTS_PER_PATH = 8
+
+
+def synthetic_svg(n_segments, seed=0):
+    """Returns an SVG document of closed shapes, alternately drawn with lines and
+    cubic curves, with `n_segments` path segments in all."""
+    rand = random.Random(seed)
+    n_paths = max(n_segments // SEGMENTS_PER_PATH, 1)
+    columns = int(n_paths ** 0.5) + 1
+    size = 20
+    parts = ['<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d">'
+             % (columns * size, columns * size)]
+    for i in xrange(n_paths):
+        x = (i % columns) * size + size / 2.0
+        y = (i // columns) * size + size / 2.0
+        points = []
+        for k in xrange(SEGMENTS_PER_PATH):
+            angle = 2 * math.pi * k / SEGMENTS_PER_PATH
+            radius = rand.uniform(4, 9)
+            points.append((x + radius * math.cos(angle), y + radius * math.sin(angle)))
+        data = ['M %.2f %.2f' % points[0]]
+        for k in xrange(1, SEGMENTS_PER_PATH + 1):
+            px, py = points[k % SEGMENTS_PER_PATH]
+            if i % 2:
+                data.append('C %.2f %.2f %.2f %.2f %.2f %.2f' % (x, y - 3, x + 3, y, px, py))
+            else:
+                data.append('L %.2f %.2f' % (px, py))
+        color = '#%02x%02x%02x' % (rand.randrange(256), rand.randrange(256), rand.randrange(256))
+        parts.append('<path d="%s Z" fill="%s" stroke="#000000"/>' % (' '.join(data), color))
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+def load_stages(filename, options):
+    """Loads `filename` once, returning the Geometry and a dict of stage times."""
+    from squirtle import geometry
+    from squirtle.stats import LoadStats
+    stats = LoadStats(filename, publish=False)
+    geom = geometry.load(filename, stats=stats, **options)
+    geom.resolve_gradients()
+    return geom, dict((stage, stats.times[stage]) for stage in LOAD_STAGES)
+
+def gl_stages(geom, mode, frames):
+    """Uploads `geom` with the renderer for `mode` and draws it `frames` times,
+    returning the upload time and the median frame time."""
+    from pyglet.gl import glFinish, glClear, GL_COLOR_BUFFER_BIT
+    from squirtle.render import renderers, TiledRenderer
+    from squirtle.svg import TILE_SIZE
+    glFinish()
+    start = time.time()
+    if mode == 'tiled':
+        renderer = TiledRenderer(geom, TILE_SIZE)
+    else:
+        renderer = renderers[mode](geom)
+    glFinish()
+    upload = time.time() - start
+    times = []
+    for i in xrange(frames):
+        glClear(GL_COLOR_BUFFER_BIT)
+        start = time.time()
+        renderer.draw()
+        glFinish()
+        times.append(time.time() - start)
+    renderer.delete()
+    times.sort()
+    return upload, times[len(times) // 2] if times else None
+
+def benchmark(name, filename, options, context, mode, repeat, frames):
+    best = {}
+    for i in xrange(repeat):
+        gc.collect()
+        geom, times = load_stages(filename, options)
+        if context:
+            times['upload'], times['draw'] = gl_stages(geom, mode, frames)
+        for stage, seconds in times.iteritems():
+            if seconds is not None:
+                best[stage] = min(best.get(stage, seconds), seconds)
+    result = {'name': name,
+              'paths': len(geom.paths),
+              'triangles': geom.n_tris,
+              'lines': geom.n_lines,
+              'bytes': geom.nbytes,
+              'stages': best}
+    if not context:
+        result['stages'].update(upload=None, draw=None)
+    return result
+
+def create_context():
+    """Creates a hidden window to provide an OpenGL context, returning it, or
+    None and the reason if that fails."""
+    try:
+        window = pyglet.window.Window(width=256, height=256, visible=False)
+        window.switch_to()
+        return window, None
+    except Exception, ex:
+        return None, '%s: %s' % (type(ex).__name__, ex)
+
+def environment():
+    info = {'python': platform.python_version(),
+            'platform': platform.platform(),
+            'pyglet': pyglet.version}
+    try:
+        import numpy
+        info['numpy'] = numpy.__version__
+    except ImportError:
+        pass
+    try:
+        here = os.path.dirname(os.path.abspath(__file__))
+        info['revision'] = subprocess.Popen(['git', 'rev-parse', 'HEAD'], cwd=here,
+                                            stdout=subprocess.PIPE,
+                                            stderr=subprocess.PIPE).communicate()[0].strip()
+    except OSError:
+        pass
+    return info
+
+def compare(results, baseline, threshold):
+    """Returns lines describing each stage slower than in `baseline` by more
+    than a factor of `threshold`."""
+    old = dict((r['name'], r['stages']) for r in baseline['results'])
+    slower = []
+    for result in results['results']:
+        before = old.get(result['name'])
+        if before is None:
+            continue
+        for stage, seconds in sorted(result['stages'].iteritems()):
+            previous = before.get(stage)
+            # Ignore stages too quick to time reliably
+            if seconds is None or not previous or max(seconds, previous) < 1e-3:
+                continue
+            if seconds > previous * threshold:
+                slower.append('%s %s: %.4fs -> %.4fs (x%.2f)' % (result['name'], stage, previous,
+                                                                 seconds, seconds / previous))
+    return slower
+
+def main():
+    op = OptionParser(usage='%prog [options] [file.svg ...]')
+    op.add_option('--sizes', default=','.join(str(s) for s in SIZES),
+                  help='comma separated path segment counts of the synthetic documents, or none')
+    op.add_option('--triangulator', default='glu', help="'glu' (the default) or 'python'")
+    op.add_option('--strokes', default='lines', help="'lines' (the default) or 'triangles'")
+    op.add_option('--tolerance', type='float', default=None,
+                  help='flatten curves adaptively to this tolerance')
+    op.add_option('--mode', default='vbo', help="renderer to time: 'vbo' (the default), "
+                                                "'displaylist' or 'tiled'")
+    op.add_option('--repeat', type='int', default=3, help='runs per document; the best is kept')
+    op.add_option('--frames', type='int', default=20, help='frames drawn per run')
+    op.add_option('--headless', action='store_true', help="use pyglet's EGL headless mode (pyglet 1.5 and later)")
+    op.add_option('--no-gl', action='store_true', help='skip the upload and draw stages')
+    op.add_option('--output', help='write the results to this file instead of stdout')
+    op.add_option('--compare', help='results file to compare against')
+    op.add_option('--threshold', type='float', default=1.1,
+                  help='slowdown factor reported by --compare, default 1.1')
+    opts, files = op.parse_args()
+
+    pyglet.options['debug_gl'] = False
+    pyglet.options['shadow_window'] = False
+    if opts.headless:
+        pyglet.options['headless'] = True
+    import squirtle
+
+    options = {'triangulator': opts.triangulator, 'strokes': opts.strokes,
+               'tolerance': opts.tolerance}
+    context = reason = None
+    if opts.no_gl:
+        reason = 'disabled'
+    else:
+        context, reason = create_context()
+        if context is not None:
+            squirtle.setup_gl()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    documents = [(f, f) for f in files]
+    if not files:
+        corpus = os.path.join(here, 'svgs')
+        documents = [(name, os.path.join(corpus, name)) for name in sorted(os.listdir(corpus))
+                     if name.endswith('.svg') or name.endswith('.svgz')]
+    temporary = []
+    sizes = [int(s) for s in opts.sizes.split(',') if s.strip() and s != 'none']
+    for size in sizes:
+        fd, path = tempfile.mkstemp(suffix='.svg')
+        os.write(fd, synthetic_svg(size))
+        os.close(fd)
+        temporary.append(path)
+        documents.append(('synthetic-%d' % size, path))
+
+    results = {'environment': environment(),
+               'options': dict(options, mode=opts.mode, repeat=opts.repeat, frames=opts.frames),
+               'gl': reason or 'ok',
+               'results': []}
+    try:
+        for name, path in documents:
+            sys.stderr.write('%s...\n' % name)
+            results['results'].append(benchmark(name, path, options, context, opts.mode,
+                                                opts.repeat, opts.frames))
+    finally:
+        for path in temporary:
+            os.remove(path)
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if opts.output:
+        open(opts.output, 'w').write(text + '\n')
+    else:
+        print text
+
+    if opts.compare:
+        slower = compare(results, json.load(open(opts.compare)), opts.threshold)
+        for line in slower:
+            sys.stderr.write('slower: %s\n' % line)
+        if slower:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
-__all__ = ['svg', 'matrix']
+__all__ = ['svg', 'matrix', 'geometry', 'loader', 'sprite', 'resources', 'spatial', 'stats']
 
-from svg import *
\ No newline at end of file
+from svg import *
+from loader import load_many, AsyncLoader
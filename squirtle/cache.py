@@ -0,0 +1,149 @@
+"""Persistent on-disk cache of tesselated geometry.
+
+Cache files are named after a SHA-1 hash of the SVG file's contents together
+with every option which affects tesselation, so editing an asset or changing
+e.g. circle_points never returns stale geometry.
+
+Each file holds a small pickled header (document size, paths and gradients)
+followed by the raw float32 vertex and color arrays, aligned to 16 bytes.
+The arrays are memory-mapped when read, so they can be handed to
+glBufferData without being copied or parsed. The `path` and `polygon`
+lists of SvgPaths are emptied once a Geometry is built, so only the offsets
+of each path into the arrays are stored.
+
+Example usage:
+    from squirtle import cache
+    geom = cache.load_geometry('filename.svg', '/tmp/svgcache', bezier_points=5)
+
+"""
+
+import os
+import time
+import struct
+import hashlib
+import tempfile
+import cPickle as pickle
+import numpy
+
+import geometry
+
+MAGIC = 'SQTLGEOM'
+FORMAT_VERSION = 2
+ALIGNMENT = 16
+ARRAYS = ('tri_vertices', 'tri_colors', 'line_vertices', 'line_colors')
+
+_header = struct.Struct('<8sII')
+
+
+def cache_key(filename, options):
+    """Returns the cache key for `filename` tesselated with the given dict of
+    geometry options."""
+    h = hashlib.sha1()
+    h.update('%d:%r' % (FORMAT_VERSION, sorted(options.items())))
+    f = open(filename, 'rb')
+    try:
+        for chunk in iter(lambda: f.read(65536), ''):
+            h.update(chunk)
+    finally:
+        f.close()
+    return h.hexdigest()
+
+def _align(n):
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write(path, geom):
+    """Writes `geom` to the cache file `path`.
+
+    The file is written under a temporary name and then renamed, so
+    concurrent readers never see a partial file.
+
+    """
+    arrays = [numpy.ascontiguousarray(getattr(geom, name), dtype=numpy.float32)
+              for name in ARRAYS]
+    table = []
+    offset = 0
+    for name, array in zip(ARRAYS, arrays):
+        table.append((name, offset, array.shape))
+        offset = _align(offset + array.nbytes)
+    meta = pickle.dumps({'width': geom.width,
+                         'height': geom.height,
+                         'paths': geom.paths,
+                         'gradients': geom.gradients,
+                         'arrays': table}, pickle.HIGHEST_PROTOCOL)
+    data_start = _align(_header.size + len(meta))
+
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory or '.', suffix='.tmp')
+    f = os.fdopen(fd, 'wb')
+    try:
+        f.write(_header.pack(MAGIC, FORMAT_VERSION, len(meta)))
+        f.write(meta)
+        for (name, offset, shape), array in zip(table, arrays):
+            f.seek(data_start + offset)
+            f.write(array.tostring())
+        f.close()
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+    except:
+        f.close()
+        os.remove(tmp_path)
+        raise
+
+def read(path):
+    """Reads a Geometry from the cache file `path`, memory-mapping its arrays.
+
+    Raises ValueError if the file is not a cache file of the current format.
+
+    """
+    f = open(path, 'rb')
+    try:
+        magic, version, meta_len = _header.unpack(f.read(_header.size))
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("%s is not a squirtle geometry cache file of version %d" %
+                             (path, FORMAT_VERSION))
+        meta = pickle.loads(f.read(meta_len))
+    finally:
+        f.close()
+    data_start = _align(_header.size + meta_len)
+    arrays = {}
+    mapped = None
+    for name, offset, shape in meta['arrays']:
+        count = shape[0] * shape[1]
+        if not count:
+            arrays[name] = numpy.zeros(shape, dtype=numpy.float32)
+            continue
+        if mapped is None:
+            mapped = numpy.memmap(path, dtype=numpy.uint8, mode='r')
+        start = data_start + offset
+        arrays[name] = mapped[start:start + count * 4].view(numpy.float32).reshape(shape)
+    return geometry.Geometry.from_arrays(meta['width'], meta['height'], meta['paths'],
+                                         meta['gradients'], **arrays)
+
+
+def load_geometry(filename, cache_dir=None, stats=None, profile=None, **options):
+    """Returns the Geometry of `filename`, as geometry.load(filename, **options)
+    would, reading it from `cache_dir` when a matching entry exists and
+    storing it there otherwise. With no `cache_dir` the cache is bypassed.
+    Times are recorded in `stats`, and `profile`, if given, as by geometry.load().
+
+    """
+    if cache_dir is None:
+        return geometry.load(filename, stats=stats, profile=profile, **options)
+    path = os.path.join(cache_dir, cache_key(filename, options) + '.sqg')
+    if os.path.exists(path):
+        try:
+            start = time.time()
+            geom = read(path)
+            if stats is not None:
+                stats.add_time('cache', time.time() - start)
+                geom.stats = stats
+            return geom
+        except (IOError, ValueError, EOFError, struct.error, pickle.UnpicklingError), ex:
+            print 'Warning: ignoring unreadable geometry cache file %s - %s' % (path, ex)
+    geom = geometry.load(filename, stats=stats, profile=profile, **options)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    write(path, geom)
+    return geom
@@ -0,0 +1,75 @@
+"""Tolerance-driven flattening of Bezier curves and elliptical arcs.
+
+Every function takes a `tolerance`, the greatest distance allowed between
+the true curve and the line segments approximating it, in the same units as
+the coordinates. To bound the error on screen when drawing at a given scale,
+pass the desired screen tolerance divided by that scale.
+
+"""
+
+import math
+
+MAX_DEPTH = 16
+
+
+def cubic(x0, y0, x1, y1, x2, y2, x3, y3, tolerance):
+    """Flattens the cubic Bezier spline (x0, y0) - (x3, y3) by adaptive
+    subdivision, returning the [x, y] points after the starting point.
+
+    A piece is considered flat once its control points lie within
+    4/3 * tolerance of its chord, which bounds the distance from the curve to
+    the chord by `tolerance`.
+
+    """
+    points = []
+    limit = (4.0 / 3.0 * tolerance) ** 2
+    stack = [(x0, y0, x1, y1, x2, y2, x3, y3, 0)]
+    while stack:
+        x0, y0, x1, y1, x2, y2, x3, y3, depth = stack.pop()
+        dx = x3 - x0
+        dy = y3 - y0
+        d2 = dx * dx + dy * dy
+        if d2 > 0:
+            c1 = (x1 - x0) * dy - (y1 - y0) * dx
+            c2 = (x2 - x0) * dy - (y2 - y0) * dx
+            flat = max(c1 * c1, c2 * c2) <= limit * d2
+        else:
+            flat = max((x1 - x0) ** 2 + (y1 - y0) ** 2,
+                       (x2 - x0) ** 2 + (y2 - y0) ** 2) <= limit
+        if flat or depth >= MAX_DEPTH:
+            points.append([x3, y3])
+            continue
+        # de Casteljau split at t = 0.5; the second half is pushed first so
+        # that the first half is emitted first
+        x01 = (x0 + x1) * .5; y01 = (y0 + y1) * .5
+        x12 = (x1 + x2) * .5; y12 = (y1 + y2) * .5
+        x23 = (x2 + x3) * .5; y23 = (y2 + y3) * .5
+        xa = (x01 + x12) * .5; ya = (y01 + y12) * .5
+        xb = (x12 + x23) * .5; yb = (y12 + y23) * .5
+        xm = (xa + xb) * .5; ym = (ya + yb) * .5
+        stack.append((xm, ym, xb, yb, x23, y23, x3, y3, depth + 1))
+        stack.append((x0, y0, x01, y01, xa, ya, xm, ym, depth + 1))
+    return points
+
+def quadratic(x0, y0, x1, y1, x2, y2, tolerance):
+    """Flattens the quadratic Bezier spline (x0, y0) - (x2, y2), returning the
+    [x, y] points after the starting point."""
+    return cubic(*(quadratic_to_cubic(x0, y0, x1, y1, x2, y2) + (tolerance,)))
+
+def quadratic_to_cubic(x0, y0, x1, y1, x2, y2):
+    """Returns the control points of the cubic spline equal to the given
+    quadratic spline, as a tuple (x0, y0, c1x, c1y, c2x, c2y, x2, y2)."""
+    return (x0, y0,
+            x0 + 2.0 / 3.0 * (x1 - x0), y0 + 2.0 / 3.0 * (y1 - y0),
+            x2 + 2.0 / 3.0 * (x1 - x2), y2 + 2.0 / 3.0 * (y1 - y2),
+            x2, y2)
+
+def arc_segments(radius, delta, tolerance):
+    """Returns the number of equal segments needed to approximate an arc of
+    `radius` spanning `delta` radians within `tolerance`."""
+    radius = abs(radius)
+    if radius <= tolerance:
+        step = math.pi / 2
+    else:
+        step = 2 * math.acos(1 - tolerance / radius)
+    return max(int(math.ceil(abs(delta) / step)), 1)
@@ -0,0 +1,779 @@
+"""Headless SVG geometry pipeline.
+
+Parses an SVG file, flattens its curves into line loops and triangulates the
+filled areas, producing flat NumPy arrays which a renderer can upload to
+OpenGL. Nothing in this module requires an OpenGL context, so geometry can be
+built on servers or in worker processes.
+
+Example usage:
+    from squirtle import geometry
+    geom = geometry.load('filename.svg')
+    geom.tri_vertices, geom.tri_colors
+
+With triangulator='python' this module does not load OpenGL at all. The
+default GLU tesselator is CPU-only too, but pyglet's GL error checking refuses
+every GL/GLU call when no context exists, so set
+pyglet.options['debug_gl'] = False before importing squirtle when using it
+without a window.
+
+"""
+
+try:
+    import xml.etree.ElementTree
+    from xml.etree.cElementTree import parse
+except:
+    import elementtree.ElementTree
+    from elementtree.ElementTree import parse
+import math
+import time
+from cStringIO import StringIO
+import numpy
+
+from matrix import *
+from parse import *
+from gradient import *
+from triangulate import get_triangulator, TriangulationError
+from stroke import stroke_path
+from stats import LoadStats
+import flatten
+
+BEZIER_POINTS = 20
+CIRCLE_POINTS = 24
+TOLERANCE = 0.001
+
+#User units per unit of length, at the CSS resolution of 96 per inch
+LENGTH_UNITS = {'px': 1.0, 'pt': 96 / 72.0, 'pc': 16.0, 'mm': 96 / 25.4,
+                'cm': 96 / 2.54, 'in': 96.0}
+
+xmlns = 'http://www.w3.org/2000/svg'
+
+
+class SvgPath(object):
+    #Whether the path is drawn; see SVG.set_visible()
+    visible = True
+    #Whether the stroke is only a fill-coloured outline for antialiasing
+    outline = False
+
+    def __init__(self, path, stroke, polygon, fill, transform, path_id, title, desc, stroke_polygon=None):
+
+        self.path = list(path) if path else []
+        self.stroke = stroke
+        self.polygon = polygon
+        self.stroke_polygon = stroke_polygon
+        self.fill = fill
+        self.transform = Matrix(transform.values)
+        self.id = path_id
+        self.title = title
+        self.description = desc
+        self.tri_offset = self.tri_count = 0
+        self.stroke_offset = self.stroke_count = 0
+        self.line_offset = self.line_count = 0
+
+    def __repr__(self):
+        return "<SvgPath id=%s title='%s' description='%s' transform=%s>" %(
+            self.id, self.title, self.description, self.transform
+        )
+
+class Geometry(object):
+    """Tesselated SVG geometry stored as flat float32 arrays.
+
+    Triangles (`tri_vertices`, `tri_colors`) are meant to be drawn as
+    GL_TRIANGLES and strokes (`line_vertices`, `line_colors`) as GL_LINES.
+    Vertices are (x, y) pairs in each path's local coordinates and colors are
+    (r, g, b, a) in the range 0-1. Every SvgPath in `paths` records the slice
+    of the arrays it owns in `tri_offset`/`tri_count` and
+    `line_offset`/`line_count`, counted in vertices. Strokes tesselated into
+    triangles follow the fill in the triangle arrays, at
+    `stroke_offset`/`stroke_count`. Once packed into the arrays, the `path`,
+    `polygon` and `stroke_polygon` lists of the paths are emptied, so paths
+    look the same whether the geometry was built in this process, in a worker
+    or read from the cache.
+
+    Gradient colours are only evaluated the first time `tri_colors` or
+    `line_colors` is read.
+
+    """
+    #The stats.LoadStats recording how the geometry was loaded, if any
+    stats = None
+
+    def __init__(self, width, height, paths, path_lookup, gradients):
+        self.width = width
+        self.height = height
+        self.paths = paths
+        self.path_lookup = path_lookup
+        self.gradients = gradients
+
+        tri_vertices = []
+        tri_colors = []
+        line_vertices = []
+        line_colors = []
+        #(gradient id, is_line, offset, count) of slices still to be coloured
+        self.gradient_fills = []
+        for svgpath in paths:
+            svgpath.tri_offset = len(tri_vertices)
+            svgpath.line_offset = len(line_vertices)
+            if svgpath.polygon:
+                tris = svgpath.polygon
+                tri_colors.extend(self._colors(svgpath.fill, False, len(tri_vertices), len(tris)))
+                tri_vertices.extend(tris)
+            svgpath.tri_count = len(tri_vertices) - svgpath.tri_offset
+            svgpath.stroke_offset = len(tri_vertices)
+            if svgpath.stroke_polygon:
+                tris = svgpath.stroke_polygon
+                tri_colors.extend(self._colors(svgpath.stroke, False, len(tri_vertices), len(tris)))
+                tri_vertices.extend(tris)
+            svgpath.stroke_count = len(tri_vertices) - svgpath.stroke_offset
+            if svgpath.path:
+                for loop in svgpath.path:
+                    loop_plus = []
+                    for i in xrange(len(loop) - 1):
+                        loop_plus += [loop[i], loop[i+1]]
+                    line_colors.extend(self._colors(svgpath.stroke, True, len(line_vertices), len(loop_plus)))
+                    line_vertices.extend(loop_plus)
+            svgpath.line_count = len(line_vertices) - svgpath.line_offset
+            # The arrays now hold the points, so the lists are released
+            svgpath.path = []
+            svgpath.polygon = svgpath.stroke_polygon = None
+
+        self.tri_vertices = _as_array(tri_vertices, 2)
+        self._tri_colors = _as_array(tri_colors, 4) / 255.0
+        self.line_vertices = _as_array(line_vertices, 2)
+        self._line_colors = _as_array(line_colors, 4) / 255.0
+
+    @classmethod
+    def from_arrays(cls, width, height, paths, gradients,
+                    tri_vertices, tri_colors, line_vertices, line_colors):
+        """Creates a Geometry from already built arrays, such as those read from
+        a cache file. The paths must carry their array offsets."""
+        geom = cls.__new__(cls)
+        geom.width = width
+        geom.height = height
+        geom.paths = paths
+        geom.path_lookup = dict((svgpath.id, svgpath) for svgpath in paths)
+        geom.gradients = gradients
+        geom.gradient_fills = []
+        geom.tri_vertices = tri_vertices
+        geom._tri_colors = tri_colors
+        geom.line_vertices = line_vertices
+        geom._line_colors = line_colors
+        return geom
+
+    def _colors(self, paint, is_line, offset, count):
+        if isinstance(paint, str):
+            # Gradient colours are only needed when drawn without the gradient
+            # shaders, so they are evaluated on first access to the color arrays
+            self.gradient_fills.append((paint, is_line, offset, count))
+            return [[255, 255, 255, 255]] * count
+        return [paint] * count
+
+    def resolve_gradients(self):
+        """Evaluates the per-vertex colours of gradient-filled slices."""
+        if self.gradient_fills and self.stats is not None:
+            with self.stats.timer('gradients'):
+                self._resolve_gradients()
+        else:
+            self._resolve_gradients()
+
+    def _resolve_gradients(self):
+        for paint, is_line, offset, count in self.gradient_fills:
+            if is_line:
+                vertices, colors = self.line_vertices, self._line_colors
+            else:
+                vertices, colors = self.tri_vertices, self._tri_colors
+            g = self.gradients[paint]
+            colors[offset:offset + count] = g.interp_many(vertices[offset:offset + count]) / 255.0
+        self.gradient_fills = []
+
+    @property
+    def tri_colors(self):
+        if self.gradient_fills:
+            self.resolve_gradients()
+        return self._tri_colors
+
+    @property
+    def line_colors(self):
+        if self.gradient_fills:
+            self.resolve_gradients()
+        return self._line_colors
+
+    def shader_colors(self):
+        """Returns the (tri_colors, line_colors) arrays for renderers which draw
+        gradients with the gradient shaders, without evaluating gradient colours."""
+        return self._tri_colors, self._line_colors
+
+    def world_vertices(self):
+        """Returns copies of `tri_vertices` and `line_vertices` with every
+        path's transform applied, so the whole document can be drawn at once."""
+        tris = self.tri_vertices.copy()
+        lines = self.line_vertices.copy()
+        for svgpath in self.paths:
+            for verts, offset, count in ((tris, svgpath.tri_offset, svgpath.tri_count + svgpath.stroke_count),
+                                         (lines, svgpath.line_offset, svgpath.line_count)):
+                if count:
+                    verts[offset:offset + count] = svgpath.transform.apply(verts[offset:offset + count])
+        return tris, lines
+
+    def bounds(self):
+        """Returns the bounding box (min_x, min_y, max_x, max_y) of the transformed
+        geometry, or of the document if it is empty."""
+        vertices = numpy.concatenate(self.world_vertices())
+        if not len(vertices):
+            return (0.0, 0.0, float(self.width), float(self.height))
+        low = vertices.min(axis=0)
+        high = vertices.max(axis=0)
+        return (float(low[0]), float(low[1]), float(high[0]), float(high[1]))
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.tri_vertices, self._tri_colors,
+                                      self.line_vertices, self._line_colors))
+
+    @property
+    def n_tris(self):
+        return len(self.tri_vertices) // 3
+
+    @property
+    def n_lines(self):
+        return len(self.line_vertices) // 2
+
+def _vertex_count(svgpath):
+    count = len(svgpath.polygon or ()) + len(svgpath.stroke_polygon or ())
+    for loop in svgpath.path:
+        count += 2 * max(len(loop) - 1, 0)
+    return count
+
+def _as_array(values, width):
+    return numpy.array(values, dtype=numpy.float32).reshape(-1, width)
+
+
+def load(filename, bezier_points=BEZIER_POINTS, circle_points=CIRCLE_POINTS, invert_y=False,
+         tolerance=None, triangulator='glu', strokes='lines', stats=None, profile=None):
+    """Parses and tesselates a .svg or .svgz file, returning a Geometry.
+
+        `filename`: str
+            The name of the file to be loaded.
+        `bezier_points`: int
+            The number of line segments into which to subdivide Bezier splines.
+        `circle_points`: int
+            The number of line segments into which to subdivide circular and elliptic arcs.
+        `invert_y`: bool
+            Flip the document vertically.
+        `tolerance`: float
+            If given, curves and arcs are subdivided adaptively so that they stray no further 
+            than this from the true shape, in document units, and `bezier_points` and 
+            `circle_points` are ignored.
+        `triangulator`: str
+            The triangulation backend, 'glu' or 'python'. See triangulate.py.
+        `strokes`: str
+            'lines' draws strokes as one pixel GL_LINES, and outlines fills with lines 
+            of their own colour for antialiasing. 'triangles' tesselates strokes into 
+            triangles honouring stroke-width, stroke-linejoin, stroke-linecap and 
+            stroke-miterlimit, and draws no lines at all. See stroke.py.
+        `stats`: stats.LoadStats
+            Where to record the time spent in each phase. Defaults to a new LoadStats. 
+            It becomes the `stats` attribute of the Geometry.
+        `profile`: stats.Profile
+            If given, the load time and vertex count of every element are recorded in it.
+
+    """
+    if stats is None:
+        stats = LoadStats(filename)
+    parser = SvgParser(filename, bezier_points, circle_points, invert_y, tolerance, triangulator,
+                       strokes, stats, profile)
+    parser.parse()
+    with stats.timer('arrays'):
+        geom = Geometry(parser.width, parser.height, parser.paths,
+                        parser.path_lookup, parser.gradients)
+    geom.stats = stats
+    return geom
+
+
+class SvgParser(object):
+    """Converts an SVG document into a list of flattened, triangulated SvgPaths."""
+
+    def __init__(self, filename, bezier_points=BEZIER_POINTS, circle_points=CIRCLE_POINTS, invert_y=False,
+                 tolerance=None, triangulator='glu', strokes='lines', stats=None, profile=None):
+        if strokes not in ('lines', 'triangles'):
+            raise ValueError("Unknown strokes mode %r; expected 'lines' or 'triangles'" % (strokes,))
+        self.strokes = strokes
+        self.path_lookup = {}
+        self.paths = []
+        self.invert_y = invert_y
+        self.filename = filename
+        self.bezier_points = bezier_points
+        self.circle_points = circle_points
+        self.tolerance = tolerance
+        self.triangulator = get_triangulator(triangulator)
+        self.bezier_coefficients = []
+        self.gradients = GradientContainer()
+        self.stats = stats if stats is not None else LoadStats(filename, publish=False)
+        self.profile = profile
+        self.tokenize_time = self.triangulate_time = 0.0
+
+    def parse(self):
+        with self.stats.timer('read'):
+            if open(self.filename, 'rb').read(3) == '\x1f\x8b\x08': #gzip magic numbers
+                import gzip
+                f = gzip.open(self.filename, 'rb')
+            else:
+                f = open(self.filename, 'rb')
+            try:
+                data = f.read()
+            finally:
+                f.close()
+        with self.stats.timer('xml'):
+            self.tree = parse(StringIO(data))
+        # Tokenizing and triangulation happen once per path, so are summed here
+        # and recorded once; flattening is the rest of the document walk
+        self.tokenize_time = self.triangulate_time = 0.0
+        start = time.time()
+        self.parse_doc()
+        elapsed = time.time() - start
+        self.stats.add_time('tokenize', self.tokenize_time)
+        self.stats.add_time('triangulate', self.triangulate_time)
+        self.stats.add_time('flatten', elapsed - self.tokenize_time - self.triangulate_time)
+
+    def parse_float(self, txt):
+        if txt.endswith('px'):
+            return float(txt[:-2])
+        else:
+            return float(txt)
+
+    def parse_length(self, txt, default=1.0):
+        """Returns the length `txt` in user units, converting absolute units and 
+        percentages of the document size. Warns and returns `default` for 
+        anything else, such as font-relative units."""
+        txt = txt.strip()
+        try:
+            if txt.endswith('%'):
+                # Percentages are of the normalised diagonal of the viewport
+                diagonal = math.sqrt((self.width ** 2 + self.height ** 2) / 2.0)
+                return float(txt[:-1]) * diagonal / 100.0
+            unit = txt[-2:]
+            if unit in LENGTH_UNITS:
+                return float(txt[:-2]) * LENGTH_UNITS[unit]
+            return float(txt)
+        except ValueError:
+            self.warn("Unsupported length: %s" % txt)
+            return default
+
+
+    def parse_doc(self):
+        self.paths = []
+        self.width = self.parse_float(self.tree._root.get("width", '0'))
+        self.height = self.parse_float(self.tree._root.get("height", '0'))
+        if self.height:
+            if self.invert_y:
+                self.transform = Matrix([1, 0, 0, -1, 0, self.height])
+            else:
+                self.transform = Matrix([1, 0, 0, 1, 0, 0])
+        else:
+            x, y, w, h = (self.parse_float(x) for x in parse_list(self.tree._root.get("viewBox")))
+            if self.invert_y:
+                self.transform = Matrix([1, 0, 0, -1, 0, 0])
+            else:
+                self.transform = Matrix([1, 0, 0, 1, 0, 0])
+            self.height = h
+            self.width = w
+        self.opacity = 1.0
+        self.fill_rule = 'nonzero'
+        self.stroke_width = 1.0
+        self.stroke_linejoin = 'miter'
+        self.stroke_linecap = 'butt'
+        self.stroke_miterlimit = 4.0
+        for e in self.tree._root.getchildren():
+            try:
+                self.parse_element(e)
+            except Exception, ex:
+                print 'Exception while parsing element', e
+                raise
+
+    def parse_element(self, e):
+        profile = self.profile
+        if profile is not None:
+            record = profile.begin(e.tag, e.get('id', ''))
+            start = time.time()
+            tokenize_time = self.tokenize_time
+            triangulate_time = self.triangulate_time
+            n_paths = len(self.paths)
+        default = object()
+        self.fill = parse_color(e.get('fill'), default)
+        self.stroke = parse_color(e.get('stroke'), default)
+        oldopacity = self.opacity
+        self.opacity *= float(e.get('opacity', 1))
+        oldfillrule = self.fill_rule
+        self.fill_rule = e.get('fill-rule', self.fill_rule)
+        oldstrokestyle = (self.stroke_width, self.stroke_linejoin, self.stroke_linecap,
+                          self.stroke_miterlimit)
+        self.parse_stroke_style(e.get)
+        fill_opacity = float(e.get('fill-opacity', 1))
+        stroke_opacity = float(e.get('stroke-opacity', 1))
+        self.path_id = e.get('id', '')
+        self.path_title = e.findtext('{%s}title' % (xmlns,))
+        self.path_description = e.findtext('{%s}desc' % (xmlns,))
+
+
+        oldtransform = self.transform
+        self.transform = self.transform * Matrix(e.get('transform'))
+
+        style = e.get('style')
+        if style:
+            sdict = parse_style(style)
+            if 'fill' in sdict:
+                self.fill = parse_color(sdict['fill'])
+            if 'fill-opacity' in sdict:
+                fill_opacity *= float(sdict['fill-opacity'])
+            if 'stroke' in sdict:
+                self.stroke = parse_color(sdict['stroke'])
+            if 'stroke-opacity' in sdict:
+                stroke_opacity *= float(sdict['stroke-opacity'])
+            if 'fill-rule' in sdict:
+                self.fill_rule = sdict['fill-rule'].strip()
+            self.parse_stroke_style(sdict.get)
+        if self.fill == default:
+            self.fill = [0, 0, 0, 255]
+        if self.stroke == default:
+            self.stroke = [0, 0, 0, 0]
+        if isinstance(self.stroke, list):
+            self.stroke[3] = int(self.opacity * stroke_opacity * self.stroke[3])
+        if isinstance(self.fill, list):
+            self.fill[3] = int(self.opacity * fill_opacity * self.fill[3])
+        self.stroke_is_fill = False
+        if isinstance(self.stroke, list) and self.stroke[3] == 0:
+            self.stroke = self.fill #Stroked edges antialias better
+            self.stroke_is_fill = True
+
+        if e.tag.endswith('path'):
+            self.new_path()
+            tokenize_start = time.time()
+            commands = []
+            error = None
+            try:
+                for command in parse_path(e.get('d', '')):
+                    commands.append(command)
+            except ValueError, ex:
+                error = ex
+            self.tokenize_time += time.time() - tokenize_start
+            prev_opcode = ''
+            for opcode, args in commands:
+                self.path_command(opcode, args, prev_opcode)
+                prev_opcode = opcode
+            if error is not None:
+                # Render everything up to the error, as the SVG spec requires
+                self.warn(str(error))
+            self.end_path()
+        elif e.tag.endswith('rect'):
+            x = float(e.get('x'))
+            y = float(e.get('y'))
+            h = float(e.get('height'))
+            w = float(e.get('width'))
+            self.new_path()
+            self.set_position(x, y)
+            self.line_to(x+w,y)
+            self.line_to(x+w,y+h)
+            self.line_to(x,y+h)
+            self.line_to(x,y)
+            self.end_path()
+        elif e.tag.endswith('polyline') or e.tag.endswith('polygon'):
+            points = parse_numbers(e.get('points', ''))
+            self.new_path()
+            for i in xrange(0, len(points) - 1, 2):
+                self.line_to(points[i], points[i + 1])
+            if e.tag.endswith('polygon'):
+                self.close_path()
+            self.end_path()
+        elif e.tag.endswith('line'):
+            x1 = float(e.get('x1'))
+            y1 = float(e.get('y1'))
+            x2 = float(e.get('x2'))
+            y2 = float(e.get('y2'))
+            self.new_path()
+            self.set_position(x1, y1)
+            self.line_to(x2, y2)
+            self.end_path()
+        elif e.tag.endswith('circle'):
+            cx = float(e.get('cx'))
+            cy = float(e.get('cy'))
+            r = float(e.get('r'))
+            self.new_path()
+            n_points = self.arc_points(r, 2 * math.pi)
+            for i in xrange(n_points):
+                theta = 2 * i * math.pi / n_points
+                self.line_to(cx + r * math.cos(theta), cy + r * math.sin(theta))
+            self.close_path()
+            self.end_path()
+        elif e.tag.endswith('ellipse'):
+            cx = float(e.get('cx'))
+            cy = float(e.get('cy'))
+            rx = float(e.get('rx'))
+            ry = float(e.get('ry'))
+            self.new_path()
+            n_points = self.arc_points(max(rx, ry), 2 * math.pi)
+            for i in xrange(n_points):
+                theta = 2 * i * math.pi / n_points
+                self.line_to(cx + rx * math.cos(theta), cy + ry * math.sin(theta))
+            self.close_path()
+            self.end_path()
+        elif e.tag.endswith('linearGradient'):
+            self.gradients[e.get('id')] = LinearGradient(e, self)
+        elif e.tag.endswith('radialGradient'):
+            self.gradients[e.get('id')] = RadialGradient(e, self)
+        if profile is not None:
+            record.tokenize = self.tokenize_time - tokenize_time
+            record.triangulate = self.triangulate_time - triangulate_time
+            record.flatten = time.time() - start - record.tokenize - record.triangulate
+            record.vertices = sum(_vertex_count(p) for p in self.paths[n_paths:])
+        for c in e.getchildren():
+            try:
+                self.parse_element(c)
+            except Exception, ex:
+                print 'Exception while parsing element', c
+                raise
+        if profile is not None:
+            record.total = time.time() - start
+        self.transform = oldtransform
+        self.opacity = oldopacity
+        self.fill_rule = oldfillrule
+        (self.stroke_width, self.stroke_linejoin, self.stroke_linecap,
+         self.stroke_miterlimit) = oldstrokestyle
+
+    def parse_stroke_style(self, get):
+        # `get` looks up a property in the element's attributes or style. The
+        # stroke geometry only matters when strokes are tesselated
+        if self.strokes != 'triangles':
+            return
+        width = get('stroke-width')
+        if width:
+            self.stroke_width = self.parse_length(width)
+        join = get('stroke-linejoin')
+        if join and join.strip() in ('miter', 'round', 'bevel'):
+            self.stroke_linejoin = join.strip()
+        cap = get('stroke-linecap')
+        if cap and cap.strip() in ('butt', 'round', 'square'):
+            self.stroke_linecap = cap.strip()
+        limit = get('stroke-miterlimit')
+        if limit:
+            try:
+                self.stroke_miterlimit = max(float(limit), 1.0)
+            except ValueError:
+                self.warn("Invalid stroke-miterlimit: %s" % limit)
+
+    def path_command(self, opcode, args, prev_opcode):
+        """Applies one command yielded by parse.parse_path to the current path."""
+        if opcode.islower():
+            mx, my = self.x, self.y
+        else:
+            mx = my = 0
+        op = opcode.upper()
+        if op == 'M':
+            self.move_to(mx + args[0], my + args[1])
+        elif op == 'L':
+            self.line_to(mx + args[0], my + args[1])
+        elif op == 'H':
+            self.line_to(mx + args[0], self.y)
+        elif op == 'V':
+            self.line_to(self.x, my + args[0])
+        elif op == 'C':
+            x1, y1, x2, y2, x, y = args
+            self.curve_to(mx + x1, my + y1, mx + x2, my + y2, mx + x, my + y)
+        elif op == 'S':
+            if prev_opcode in ('C', 'c', 'S', 's'):
+                x1, y1 = 2 * self.x - self.last_cx, 2 * self.y - self.last_cy
+            else:
+                x1, y1 = self.x, self.y
+            x2, y2, x, y = args
+            self.curve_to(x1, y1, mx + x2, my + y2, mx + x, my + y)
+        elif op == 'Q':
+            x1, y1, x, y = args
+            self.quadratic_to(mx + x1, my + y1, mx + x, my + y)
+        elif op == 'T':
+            x1, y1 = self.reflected_quadratic_control(prev_opcode)
+            self.quadratic_to(x1, y1, mx + args[0], my + args[1])
+        elif op == 'A':
+            rx, ry, phi, large_arc, sweep, x, y = args
+            self.arc_to(abs(rx), abs(ry), phi, int(large_arc), int(sweep), mx + x, my + y)
+        elif op == 'Z':
+            self.close_path()
+        else:
+            self.warn("Unrecognised opcode: " + opcode)
+
+    def new_path(self):
+        self.x = 0
+        self.y = 0
+        self.start_x = 0
+        self.start_y = 0
+        self.close_index = 0
+        self.closed = False
+        self.path = []
+        self.loop = []
+
+    def move_to(self, x, y):
+        if self.loop:
+            self.path.append(self.loop)
+            self.loop = []
+        self.start_x = x
+        self.start_y = y
+        self.closed = False
+        self.set_position(x, y)
+
+    def close_path(self):
+        if self.loop:
+            self.loop.append(self.loop[0][:])
+            self.path.append(self.loop)
+            self.loop = []
+        self.x = self.start_x
+        self.y = self.start_y
+        self.closed = True
+
+    def begin_segment(self):
+        # A segment drawn straight after a close starts from the subpath's start point
+        if self.closed and not self.loop:
+            self.closed = False
+            self.loop.append([self.x, self.y])
+
+    def set_position(self, x, y):
+        self.x = x
+        self.y = y
+        self.loop.append([x,y])
+
+    def arc_to(self, rx, ry, phi, large_arc, sweep, x, y):
+        # This function is made out of magical fairy dust
+        # http://www.w3.org/TR/2003/REC-SVG11-20030114/implnote.html#ArcImplementationNotes
+        x1 = self.x
+        y1 = self.y
+        x2 = x
+        y2 = y
+        if not rx or not ry:
+            self.line_to(x, y)
+            return
+        if x1 == x2 and y1 == y2:
+            return
+        phi = math.radians(phi)
+        cp = math.cos(phi)
+        sp = math.sin(phi)
+        dx = .5 * (x1 - x2)
+        dy = .5 * (y1 - y2)
+        x_ = cp * dx + sp * dy
+        y_ = -sp * dx + cp * dy
+        scale = (x_ / rx)**2 + (y_ / ry)**2
+        if scale > 1:
+            # Radii too small to reach the end point are scaled up to fit
+            rx *= math.sqrt(scale)
+            ry *= math.sqrt(scale)
+        r2 = (((rx * ry)**2 - (rx * y_)**2 - (ry * x_)**2)/
+	      ((rx * y_)**2 + (ry * x_)**2))
+        if r2 < 0: r2 = 0
+        r = math.sqrt(r2)
+        if large_arc == sweep:
+            r = -r
+        cx_ = r * rx * y_ / ry
+        cy_ = -r * ry * x_ / rx
+        cx = cp * cx_ - sp * cy_ + .5 * (x1 + x2)
+        cy = sp * cx_ + cp * cy_ + .5 * (y1 + y2)
+        def angle(u, v):
+            c = (u[0]*v[0] + u[1]*v[1]) / math.sqrt((u[0]**2 + u[1]**2) * (v[0]**2 + v[1]**2))
+            a = math.acos(max(-1.0, min(1.0, c)))
+            sgn = 1 if u[0]*v[1] > u[1]*v[0] else -1
+            return sgn * a
+
+        psi = angle((1,0), ((x_ - cx_)/rx, (y_ - cy_)/ry))
+        delta = angle(((x_ - cx_)/rx, (y_ - cy_)/ry),
+                      ((-x_ - cx_)/rx, (-y_ - cy_)/ry))
+        if sweep and delta < 0: delta += math.pi * 2
+        if not sweep and delta > 0: delta -= math.pi * 2
+        n_points = self.arc_points(max(rx, ry), delta)
+
+        for i in xrange(n_points + 1):
+            theta = psi + i * delta / n_points
+            ct = math.cos(theta)
+            st = math.sin(theta)
+            self.line_to(cp * rx * ct - sp * ry * st + cx,
+                         sp * rx * ct + cp * ry * st + cy)
+
+    def arc_points(self, radius, delta):
+        """Returns the number of segments to use for an arc spanning `delta` radians."""
+        if self.tolerance:
+            return flatten.arc_segments(radius, delta, self.tolerance)
+        if abs(delta) >= 2 * math.pi:
+            return self.circle_points
+        return max(int(abs(self.circle_points * delta / (2 * math.pi))), 1)
+
+    def reflected_quadratic_control(self, prev_opcode):
+        if prev_opcode in ('Q', 'q', 'T', 't'):
+            return 2 * self.x - self.last_qx, 2 * self.y - self.last_qy
+        return self.x, self.y
+
+    def quadratic_to(self, x1, y1, x, y):
+        self.last_qx = x1
+        self.last_qy = y1
+        self.curve_to(*flatten.quadratic_to_cubic(self.x, self.y, x1, y1, x, y)[2:])
+
+    def curve_to(self, x1, y1, x2, y2, x, y):
+        self.begin_segment()
+        if self.tolerance:
+            self.last_cx = x2
+            self.last_cy = y2
+            self.loop.extend(flatten.cubic(self.x, self.y, x1, y1, x2, y2, x, y, self.tolerance))
+            self.x, self.y = x, y
+            return
+        if not self.bezier_coefficients:
+            for i in xrange(self.bezier_points+1):
+                t = float(i)/self.bezier_points
+                t0 = (1 - t) ** 3
+                t1 = 3 * t * (1 - t) ** 2
+                t2 = 3 * t ** 2 * (1 - t)
+                t3 = t ** 3
+                self.bezier_coefficients.append([t0, t1, t2, t3])
+        self.last_cx = x2
+        self.last_cy = y2
+        for i, t in enumerate(self.bezier_coefficients):
+            px = t[0] * self.x + t[1] * x1 + t[2] * x2 + t[3] * x
+            py = t[0] * self.y + t[1] * y1 + t[2] * y2 + t[3] * y
+            self.loop.append([px, py])
+
+        self.x, self.y = px, py
+
+    def line_to(self, x, y):
+        self.begin_segment()
+        self.set_position(x, y)
+
+    def end_path(self):
+        self.path.append(self.loop)
+        if self.path:
+            path = []
+            for orig_loop in self.path:
+                if not orig_loop: continue
+                loop = [orig_loop[0]]
+                for pt in orig_loop:
+                    if (pt[0] - loop[-1][0])**2 + (pt[1] - loop[-1][1])**2 > TOLERANCE:
+                        loop.append(pt)
+                path.append(loop)
+            lines = stroke_polygon = None
+            if self.strokes == 'triangles':
+                # The antialiasing outline of fills is left out, as it is not a real stroke
+                if self.stroke and not self.stroke_is_fill:
+                    start = time.time()
+                    stroke_polygon = stroke_path(path, self.stroke_width, self.stroke_linejoin,
+                                                 self.stroke_linecap, self.stroke_miterlimit,
+                                                 self.tolerance, self.circle_points)
+                    self.triangulate_time += time.time() - start
+            elif self.stroke:
+                lines = path
+            path_object = SvgPath(lines, self.stroke,
+                               self.triangulate(path) if self.fill else None, self.fill,
+                               self.transform, self.path_id, self.path_title, self.path_description,
+                               stroke_polygon)
+            path_object.outline = lines is not None and self.stroke_is_fill
+            self.paths.append(path_object)
+            self.path_lookup[self.path_id] = path_object
+        self.path = []
+
+    def triangulate(self, looplist):
+        start = time.time()
+        try:
+            return self.triangulator.triangulate(looplist, self.fill_rule, self.warn)
+        finally:
+            self.triangulate_time += time.time() - start
+
+    def warn(self, message):
+        print "Warning: SVG Parser (%s) - %s" % (self.filename, message)
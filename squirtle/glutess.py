@@ -0,0 +1,130 @@
+"""GLU tesselator backend for triangulate.get_triangulator('glu').
+
+The GLU tesselator does its work on the CPU and needs no OpenGL context,
+although pyglet's GL error checking refuses every GL/GLU call when no context
+exists. Set pyglet.options['debug_gl'] = False to use it without a window.
+
+"""
+
+from pyglet.gl import *
+from ctypes import CFUNCTYPE, POINTER, cast, pointer, c_void_p
+import sys
+import numpy
+
+if sys.platform == 'win32':
+    from ctypes import WINFUNCTYPE
+    c_functype = WINFUNCTYPE
+else:
+    c_functype = CFUNCTYPE
+
+callback_types = {GLU_TESS_VERTEX: c_functype(None, POINTER(GLdouble)),
+                  GLU_TESS_BEGIN: c_functype(None, GLenum),
+                  GLU_TESS_END: c_functype(None),
+                  GLU_TESS_ERROR: c_functype(None, GLenum),
+                  GLU_TESS_COMBINE: c_functype(None, POINTER(GLdouble), POINTER(POINTER(GLvoid)), POINTER(GLfloat), POINTER(POINTER(GLvoid)))}
+
+
+class GLUTriangulator(object):
+    """Triangulates loops with the GLU tesselator.
+
+    The tesselator and its ctypes callbacks are created once per instance,
+    and the vertices of each loop are passed from one contiguous array.
+
+    """
+
+    def __init__(self):
+        self.tess = gluNewTess()
+        gluTessNormal(self.tess, 0, 0, 1)
+        self.tess_style = None
+        self.curr_shape = []
+        self.tlist = []
+        self.spareverts = []
+        self.warn = None
+        self._callbacks = []
+        self._set_callbacks()
+
+    def _set_callbacks(self):
+        for which, func in ((GLU_TESS_VERTEX, self._vertex),
+                            (GLU_TESS_BEGIN, self._begin),
+                            (GLU_TESS_END, self._end),
+                            (GLU_TESS_ERROR, self._error),
+                            (GLU_TESS_COMBINE, self._combine)):
+            cb = callback_types[which](func)
+            gluTessCallback(self.tess, which, cast(cb, CFUNCTYPE(None)))
+            self._callbacks.append(cb)
+
+    def _vertex(self, vertex):
+        self.curr_shape.append([vertex[0], vertex[1]])
+
+    def _begin(self, which):
+        self.tess_style = which
+
+    def _end(self):
+        shape = self.curr_shape
+        tlist = self.tlist
+        if self.tess_style == GL_TRIANGLE_FAN:
+            c = shape[0]
+            for i in xrange(1, len(shape) - 1):
+                tlist.extend([c, shape[i], shape[i + 1]])
+        elif self.tess_style == GL_TRIANGLE_STRIP:
+            for i in xrange(len(shape) - 2):
+                tlist.extend([shape[i], shape[i + 1], shape[i + 2]])
+        elif self.tess_style == GL_TRIANGLES:
+            tlist.extend(shape)
+        else:
+            self._warn("Unrecognised tesselation style: %d" % (self.tess_style,))
+        self.tess_style = None
+        self.curr_shape = []
+
+    def _error(self, code):
+        ptr = gluErrorString(code)
+        err = ''
+        idx = 0
+        while ptr[idx]:
+            err += chr(ptr[idx])
+            idx += 1
+        self._warn("GLU Tesselation Error: " + err)
+
+    def _combine(self, coords, vertex_data, weights, dataOut):
+        x, y, z = coords[0:3]
+        data = (GLdouble * 3)(x, y, z)
+        dataOut[0] = cast(pointer(data), POINTER(GLvoid))
+        self.spareverts.append(data)
+
+    def _warn(self, message):
+        if self.warn:
+            self.warn(message)
+
+    def triangulate(self, looplist, fill_rule='nonzero', warn=None):
+        tess = self.tess
+        self.tlist = []
+        self.curr_shape = []
+        self.spareverts = []
+        self.warn = warn
+        if fill_rule == 'evenodd':
+            gluTessProperty(tess, GLU_TESS_WINDING_RULE, GLU_TESS_WINDING_ODD)
+        else:
+            gluTessProperty(tess, GLU_TESS_WINDING_RULE, GLU_TESS_WINDING_NONZERO)
+
+        vertex_ptr = POINTER(GLdouble)
+        stride = 3 * numpy.dtype(numpy.float64).itemsize
+        data_arrays = []
+        gluTessBeginPolygon(tess, None)
+        for loop in looplist:
+            if not loop:
+                continue
+            data = numpy.zeros((len(loop), 3), dtype=numpy.float64)
+            data[:, :2] = loop
+            data_arrays.append(data)
+            base = data.ctypes.data
+            gluTessBeginContour(tess)
+            for i in xrange(len(loop)):
+                v_data = cast(c_void_p(base + i * stride), vertex_ptr)
+                gluTessVertex(tess, v_data, v_data)
+            gluTessEndContour(tess)
+        gluTessEndPolygon(tess)
+        tlist = self.tlist
+        self.tlist = []
+        self.spareverts = []
+        self.warn = None
+        return tlist
@@ -1,19 +1,145 @@
+import ctypes
+import numpy
+
 from parse import *
 from matrix import *
-import shader
 import shaders
 
 vertex_shader_src = shaders.vertex
-radial_shader_src = shaders.radial
-linear_shader_src = shaders.linear
+gradient_shader_src = shaders.gradient
+
+#Texels per gradient ramp, and ramps per atlas page
+RAMP_WIDTH = 256
+PAGE_ROWS = 256
+
+SPREAD_METHODS = {'pad': 0.0, 'reflect': 1.0, 'repeat': 2.0}
+
+_program = None
+
+def get_program():
+    """Returns the gradient shader program, shared by linear and radial gradients.
+    
+    The program is compiled and linked the first time it is requested, so 
+    importing this module does not need an OpenGL context.
+    
+    """
+    global _program
+    if _program is None:
+        import shader
+        _program = shader.MakeProgramFromSource(vertex_shader_src, gradient_shader_src)
+        _program.uniformi("ramps", 0)
+        _program.uniformf("rampWidth", float(RAMP_WIDTH))
+        _program.stop()
+    return _program
 
+def spread_values(t, method='pad'):
+    """Maps gradient positions `t` into the range 0-1 according to the SVG 
+    spreadMethod 'pad', 'reflect' or 'repeat'."""
+    if method == 'reflect':
+        return 1.0 - numpy.abs(numpy.mod(t, 2.0) - 1.0)
+    if method == 'repeat':
+        return t - numpy.floor(t)
+    return numpy.clip(t, 0.0, 1.0)
+
+def bake_ramp(stops, width=RAMP_WIDTH):
+    """Returns a (width, 4) uint8 array of the colours of `stops`, a sorted list 
+    of (offset, [r, g, b, a]) pairs, sampled evenly from 0 to 1."""
+    if not stops:
+        return numpy.tile(numpy.array([255, 0, 255, 255], dtype=numpy.uint8), (width, 1))
+    t = numpy.linspace(0.0, 1.0, width)
+    offsets = [stop[0] for stop in stops]
+    colors = numpy.array([stop[1] for stop in stops], dtype=numpy.float64)
+    ramp = numpy.column_stack([numpy.interp(t, offsets, colors[:, i]) for i in xrange(4)])
+    return numpy.ascontiguousarray(numpy.clip(numpy.rint(ramp), 0, 255), dtype=numpy.uint8)
+
+def ramp_key(stops):
+    """Returns a hashable key for `stops`, equal for gradients with the same ramp."""
+    return tuple((offset, tuple(color)) for offset, color in stops)
+
+
+class GradientAtlas(object):
+    """Textures holding the colour ramps of the gradients being drawn, one 
+    ramp per row, shared by every gradient with the same stops.
+    
+    Rows are added to pages of PAGE_ROWS ramps; a new page texture is created 
+    whenever the last is full. Renderers acquire() the rows of the gradients 
+    they draw and release() them when deleted, after which the row is reused 
+    for another ramp. A row's texture and coordinates never change while it 
+    is referenced, as display lists may refer to them.
+    
+    """
+    def __init__(self):
+        self.pages = []
+        #Maps ramp_key(stops) to [texture, row, references]
+        self.rows = {}
+        #(texture, row) of released rows, reused before growing the last page
+        self.free = []
+        self.used = PAGE_ROWS
 
-#create shader
-radial_shader = shader.MakeProgramFromSource(vertex_shader_src, radial_shader_src)
-radial_shader.stop()
+    def lookup(self, gradient):
+        """Returns the (texture, v) coordinates of the ramp of `gradient`, baking 
+        and uploading it on first use."""
+        key = ramp_key(gradient.stops)
+        entry = self.rows.get(key)
+        if entry is None:
+            from pyglet import gl
+            if self.free:
+                texture, row = self.free.pop()
+            else:
+                if self.used == PAGE_ROWS:
+                    self.pages.append(self._new_page(gl))
+                    self.used = 0
+                texture, row = self.pages[-1], self.used
+                self.used += 1
+            ramp = bake_ramp(gradient.stops)
+            gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+            gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, 0, row, RAMP_WIDTH, 1,
+                               gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, ramp.ctypes.data)
+            gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+            entry = self.rows[key] = [texture, row, 0]
+        return entry[0], (entry[1] + 0.5) / PAGE_ROWS
 
-linear_shader = shader.MakeProgramFromSource(vertex_shader_src, linear_shader_src)
-linear_shader.stop()
+    def acquire(self, gradient):
+        """References the row of `gradient`, uploading it if needed, so that it 
+        is kept until released. Returns the key to pass to release()."""
+        self.lookup(gradient)
+        key = ramp_key(gradient.stops)
+        self.rows[key][2] += 1
+        return key
+
+    def release(self, key):
+        """Drops a reference taken by acquire(), freeing the row for reuse once 
+        none are left."""
+        entry = self.rows.get(key)
+        if entry is None or not entry[2]:
+            return
+        entry[2] -= 1
+        if not entry[2]:
+            del self.rows[key]
+            self.free.append((entry[0], entry[1]))
+
+    def _new_page(self, gl):
+        tex = gl.GLuint()
+        gl.glGenTextures(1, ctypes.byref(tex))
+        gl.glBindTexture(gl.GL_TEXTURE_2D, tex.value)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP_TO_EDGE)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP_TO_EDGE)
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA8, RAMP_WIDTH, PAGE_ROWS, 0,
+                        gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, None)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+        return tex.value
+
+_atlas = None
+
+def get_atlas():
+    """Returns the shared GradientAtlas."""
+    global _atlas
+    if _atlas is None:
+        _atlas = GradientAtlas()
+    return _atlas
 
 class GradientContainer(dict):
     def __init__(self, *args, **kwargs):
@@ -36,6 +162,10 @@ class GradientContainer(dict):
     def update(self, *args, **kwargs):
         raise NotImplementedError('update not done for GradientContainer')
 
+    def __reduce__(self):
+        # Pending callbacks refer to the parser, so only the gradients are kept
+        return (GradientContainer, (dict(self),))
+
     def __setitem__(self, key, val):
         dict.__setitem__(self, key, val)
         callbacks = self.callback_dict.get(key, [])
@@ -44,6 +174,8 @@ class GradientContainer(dict):
         
     
 class Gradient(object):
+    spread = 'pad'
+
     def __init__(self, element, svg):
         self.element = element
         self.stops = {}
@@ -75,10 +207,19 @@ class Gradient(object):
                 return
         if not delay_params:
             self.get_params(parent)
+
+    def __getstate__(self):
+        # Drop the XML element and parser, which are only needed while parsing
+        state = self.__dict__.copy()
+        state.pop('element', None)
+        state.pop('svg', None)
+        return state
         
     def interp(self, pt):
         if not self.stops: return [255, 0, 255, 255]
         t = self.grad_value(self.inv_transform(pt))
+        if self.spread != 'pad':
+            t = float(spread_values(t, self.spread))
         if t < self.stops[0][0]:
             return self.stops[0][1]
         for n, top in enumerate(self.stops[1:]):
@@ -90,6 +231,19 @@ class Gradient(object):
                 return [int(x[0] * (1 - alpha) + x[1] * alpha) for x in zip(bottom[1], top[1])]
         return self.stops[-1][1]
 
+    def interp_many(self, points):
+        """Returns the colours of the gradient at an (n, 2) array of points, as an 
+        (n, 4) float array of 0-255 values. Equivalent to calling interp() on each 
+        point, but evaluated with NumPy in one pass."""
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        if not self.stops:
+            return numpy.tile(numpy.array([255.0, 0.0, 255.0, 255.0]), (len(points), 1))
+        points = self.inv_transform.apply(points)
+        t = spread_values(self.grad_values(points[:, 0], points[:, 1]), self.spread)
+        offsets = [stop[0] for stop in self.stops]
+        colors = numpy.array([stop[1] for stop in self.stops], dtype=numpy.float64)
+        return numpy.column_stack([numpy.interp(t, offsets, colors[:, i]) for i in xrange(4)])
+
     def get_params(self, parent):
         for param in self.params:
             v = None
@@ -100,94 +254,74 @@ class Gradient(object):
                 v = float(my_v)
             if v:
                 setattr(self, param, v)
+        spread = self.element.get('spreadMethod')
+        if spread in SPREAD_METHODS:
+            self.spread = spread
+        elif parent:
+            self.spread = parent.spread
 
     def tardy_gradient_parsed(self, gradient):
         self.get_params(gradient)
         
-    def apply_shader(self, transform): pass
-    
-    def unapply_shader(self, transform): pass
+    def apply_shader(self, transform, pretransformed=False):
+        """Starts drawing with the gradient shader set up for this gradient. 
+        Returns False, leaving vertex colours in use, if it has no stops.
+        
+        If `pretransformed` is True the vertices have already had the path 
+        transform `transform` applied, and the shader undoes it.
         
+        """
+        if not self.stops: return False
+        inv_transform = self.inv_transform
+        if pretransformed:
+            inv_transform = inv_transform * transform.inverse()
+        texture, row = get_atlas().lookup(self)
+        program = get_program()
+        program.use()
+        program.uniformf("rampRow", row)
+        program.uniformf("kind", self.kind)
+        program.uniformf("spread", SPREAD_METHODS[self.spread])
+        program.uniformf("geometry", *self.shader_geometry())
+        program.uniformMatrixf("invGradientTransform", False,
+                               svg_matrix_to_gl_matrix(inv_transform))
+        from pyglet import gl
+        gl.glActiveTexture(gl.GL_TEXTURE0)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+        return True
+    
+    def unapply_shader(self, transform=None):
+        if not self.stops: return
+        stop_shader()
+
+def stop_shader():
+    """Stops drawing with the gradient shader."""
+    from pyglet import gl
+    gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+    get_program().stop()
+
 class LinearGradient(Gradient):
     params = ['x1', 'x2', 'y1', 'y2', 'stops']
+    kind = 0.0
+
     def grad_value(self, pt):
         return ((pt[0] - self.x1)*(self.x2 - self.x1) + (pt[1] - self.y1)*(self.y2 - self.y1)) / ((self.x1 - self.x2)**2 + (self.y1 - self.y2)**2)
-    
-    def apply_shader(self, transform):
-        if not self.stops: return
-        linear_shader.use()
-        linear_shader.uniformf("start", self.x1, self.y1)
-        linear_shader.uniformf("end", self.x2, self.y2)
-        linear_shader.uniformMatrixf("worldTransform", False, svg_matrix_to_gl_matrix(transform))
-        linear_shader.uniformMatrixf("gradientTransform",
-                                     False,
-                                     svg_matrix_to_gl_matrix(self.grad_transform))
-        stop_points = []
-        for stop in self.stops:
-            stop_point, color = stop
-            stop_points.append(stop_point)
-        while len(stop_points) < 5:
-            stop_points.append(0.0)
-        
-        #can't support more than 5 of these bad boys..
-        if len(stop_points) > 5:
-            stop_points = stop_points[:5]
-        
-        linear_shader.uniformf("stops", *(stop_points[1:]))
-        
-        def get_stop(i):
-            return self.stops[i] if i < len(self.stops) else (1.0, [0.0, 0.0, 0.0, 0.0])
-        
-        for i in xrange(len(stop_points)):
-            stop_point, color = get_stop(i)
-            color = tuple(float(x)/255.0 for x in color)
-            linear_shader.uniformf("stop" + str(i), *color)
-    
-    def unapply_shader(self):
-        if not self.stops: return
-        linear_shader.stop()
+
+    def grad_values(self, x, y):
+        return ((x - self.x1)*(self.x2 - self.x1) + (y - self.y1)*(self.y2 - self.y1)) / float((self.x1 - self.x2)**2 + (self.y1 - self.y2)**2)
+
+    def shader_geometry(self):
+        return (self.x1, self.y1, self.x2, self.y2)
 
 class RadialGradient(Gradient):
     params = ['cx', 'cy', 'r', 'stops']
+    kind = 1.0
 
     def grad_value(self, pt):
 
         return math.sqrt((pt[0] - self.cx) ** 2 + (pt[1] - self.cy) ** 2)/self.r
-        
-    def apply_shader(self, transform):
-        if not self.stops: return
-        radial_shader.use()
-        radial_shader.uniformf("radius", self.r)
-        radial_shader.uniformf("center", self.cx, self.cy)
-        radial_shader.uniformMatrixf("worldTransform", False, svg_matrix_to_gl_matrix(transform))
-        radial_shader.uniformMatrixf("gradientTransform",
-                                     False,
-                                     svg_matrix_to_gl_matrix(self.grad_transform))
-        radial_shader.uniformMatrixf("invGradientTransform",
-                                     False,
-                                     svg_matrix_to_gl_matrix(self.inv_transform))
-        stop_points = []
-        for stop in self.stops:
-            stop_point, color = stop
-            stop_points.append(stop_point)
-        
-        while len(stop_points) < 5:
-            stop_points.append(0.0)
-        
-        #can't support more than 4 of these bad boys..
-        if len(stop_points) > 5:
-            stop_points = stop_points[:5]
-        
-        radial_shader.uniformf("stops", *(stop_points[1:]))
-        
-        def get_stop(i):
-            return self.stops[i] if i < len(self.stops) else (1.0, [0.0, 0.0, 0.0, 0.0])
-        
-        for i in xrange(len(stop_points)):
-            stop_point, color = get_stop(i)
-            color = tuple(float(x)/255.0 for x in color)
-            radial_shader.uniformf("stop" + str(i), *color)
-    
-    def unapply_shader(self):
-        if not self.stops: return
-        radial_shader.stop()
+
+    def grad_values(self, x, y):
+        return numpy.hypot(x - self.cx, y - self.cy) / float(self.r)
+
+    def shader_geometry(self):
+        return (self.cx, self.cy, self.r, 0.0)
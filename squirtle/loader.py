@@ -0,0 +1,247 @@
+"""Bulk and asynchronous loading of SVG files in worker processes.
+
+Example usage:
+    import squirtle
+    ship, rock, sun = squirtle.load_many(['ship.svg', 'rock.svg', 'sun.svg'],
+                                         workers=4, anchor_x='center')
+
+Parsing and tesselation run in the workers, which return Geometry objects;
+only the upload to OpenGL happens in the calling process, which must have a
+current context. Workers never touch OpenGL state, but when using the default
+GLU triangulator on a platform which starts workers without forking, disable
+pyglet's GL error checking (pyglet.options['debug_gl'] = False) or pass
+triangulator='python'.
+
+"""
+
+import time
+import multiprocessing
+
+from svg import SVG
+from cache import load_geometry
+from render import VBORenderer
+from stats import LoadStats
+
+
+def _load_job(job):
+    filename, cache_dir, options = job
+    # Times reach the SVG's stats, and any hooks, when the geometry is handed over
+    return load_geometry(filename, cache_dir, LoadStats(filename, publish=False), **options)
+
+def load_geometries(jobs, workers=None):
+    """Runs (filename, cache_dir, options) jobs, returning a Geometry for each.
+
+    Identical jobs are only run once. With more than one worker the jobs are
+    spread over a multiprocessing pool, otherwise they run in this process.
+
+    """
+    unique = []
+    index = {}
+    for job in jobs:
+        key = (job[0], job[1], tuple(sorted(job[2].items())))
+        if key not in index:
+            index[key] = len(unique)
+            unique.append(job)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = min(workers, len(unique))
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(_load_job, unique, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_load_job(job) for job in unique]
+    return [results[index[(job[0], job[1], tuple(sorted(job[2].items())))]] for job in jobs]
+
+def geometry_job(svg):
+    """Returns the (filename, cache_dir, options) job which loads the base level
+    of detail of a deferred SVG."""
+    return (svg.filename, svg.cache_dir, svg.geometry_options(svg.select_lod(1.0)))
+
+def load_many(filenames, workers=None, **opts):
+    """Creates an SVG object for each of `filenames`, parsing and tesselating
+    them in parallel.
+
+        `filenames`: sequence of str
+            The names of the files to be loaded.
+        `workers`: int
+            The number of worker processes. Defaults to the number of CPUs; 1
+            loads every file in the calling process.
+        `opts`
+            Keyword arguments passed to every SVG, e.g. anchor_x or mode.
+
+    Returns a list of SVG objects in the same order as `filenames`.
+
+    """
+    svgs = [SVG(filename, defer=True, **opts) for filename in filenames]
+    pending = [svg for svg in svgs if not svg.has_geometry(svg.select_lod(1.0))]
+    geometries = load_geometries([geometry_job(svg) for svg in pending], workers)
+    for svg, geometry in zip(pending, geometries):
+        svg.set_geometry(geometry, svg.select_lod(1.0))
+    for svg in svgs:
+        svg.generate_disp_list()
+    return svgs
+
+
+class LoadFuture(object):
+    """The pending result of AsyncLoader.load().
+
+    `svg` is available straight away as a placeholder which draws nothing
+    until it becomes ready.
+
+    """
+
+    def __init__(self, loader, svg, async_result):
+        self.loader = loader
+        self.svg = svg
+        self.async_result = async_result
+        self.renderer = None
+        self.exception = None
+        self.finished = False
+        self.callbacks = []
+
+    def done(self):
+        """Returns True once the SVG is ready or loading has failed."""
+        return self.finished
+
+    def add_done_callback(self, callback):
+        """Calls callback(future) once loading finishes, or immediately if it already has."""
+        if self.finished:
+            callback(self)
+        else:
+            self.callbacks.append(callback)
+
+    def result(self):
+        """Returns the ready SVG, raising any exception raised while loading it.
+
+        If loading has not finished, this waits for the worker and completes the
+        upload immediately, regardless of the frame budget. It must be called
+        from the thread owning the OpenGL context.
+
+        """
+        if not self.finished:
+            self.loader._finish(self)
+        if self.exception is not None:
+            raise self.exception
+        return self.svg
+
+    def _step(self, max_bytes):
+        # Advances loading by at most `max_bytes` of upload; returns True when finished
+        svg = self.svg
+        lod_scale = svg.select_lod(1.0)
+        if self.renderer is None:
+            if svg.has_renderer(lod_scale):
+                # Already uploaded, e.g. for another SVG of the same file
+                svg.generate_disp_list()
+                self._complete()
+                return True
+            if not svg.has_geometry(lod_scale):
+                if self.async_result is None:
+                    # The cached geometry was evicted after load(), so parse it again
+                    self.async_result = self.loader.pool.apply_async(_load_job, (geometry_job(svg),))
+                    return False
+                try:
+                    svg.set_geometry(self.async_result.get(), lod_scale)
+                except Exception, ex:
+                    self._complete(ex)
+                    return True
+            if svg.mode != 'vbo':
+                # Display lists cannot be built piecewise
+                svg.generate_disp_list()
+                self._complete()
+                return True
+            with svg.stats.timer('upload'):
+                self.renderer = VBORenderer(svg.get_geometry(lod_scale), upload=False)
+        with svg.stats.timer('upload'):
+            uploaded = self.renderer.upload(max_bytes)
+        if uploaded:
+            svg.set_renderer(self.renderer, lod_scale)
+            svg.generate_disp_list()
+            self._complete()
+            return True
+        return False
+
+    def _complete(self, exception=None):
+        self.exception = exception
+        self.finished = True
+        for callback in self.callbacks:
+            callback(self)
+        self.callbacks = []
+
+
+class AsyncLoader(object):
+    """Loads SVGs in the background without stalling the frame loop.
+
+    Parsing and tesselation run in a pool of worker processes. Uploading to
+    OpenGL happens in tick(), which should be called once per frame from the
+    thread owning the context (start() schedules it on the pyglet clock), and
+    which spends at most `budget` seconds uploading before returning. With
+    mode='vbo' the vertex data is sent in chunks of `chunk_bytes`, so even
+    large files are spread over several frames; display lists are compiled
+    in a single step.
+
+    Example usage:
+        loader = squirtle.AsyncLoader(budget=0.004)
+        loader.start()
+        future = loader.load('ship.svg', mode='vbo', anchor_x='center')
+        ship = future.svg    # draws nothing until ship.ready is True
+
+    """
+
+    def __init__(self, workers=None, budget=0.004, chunk_bytes=65536):
+        self.pool = multiprocessing.Pool(workers)
+        self.budget = budget
+        self.chunk_bytes = chunk_bytes
+        self.pending = []
+        self.scheduled = False
+
+    def load(self, filename, **opts):
+        """Starts loading `filename` with the given SVG options, returning a LoadFuture."""
+        svg = SVG(filename, defer=True, **opts)
+        async_result = None
+        if not svg.has_geometry(svg.select_lod(1.0)):
+            async_result = self.pool.apply_async(_load_job, (geometry_job(svg),))
+        future = LoadFuture(self, svg, async_result)
+        self.pending.append(future)
+        return future
+
+    def tick(self, dt=None):
+        """Uploads finished geometry until the time budget for this frame is spent."""
+        deadline = time.time() + self.budget
+        for future in list(self.pending):
+            if time.time() >= deadline:
+                break
+            while time.time() < deadline:
+                if future.async_result is not None and not future.async_result.ready():
+                    break
+                if future._step(self.chunk_bytes):
+                    self.pending.remove(future)
+                    break
+
+    def _finish(self, future):
+        while not future._step(None):
+            pass
+        self.pending.remove(future)
+
+    def start(self):
+        """Schedules tick() to run every frame on the pyglet clock."""
+        if not self.scheduled:
+            import pyglet.clock
+            pyglet.clock.schedule(self.tick)
+            self.scheduled = True
+
+    def stop(self):
+        """Unschedules tick() from the pyglet clock."""
+        if self.scheduled:
+            import pyglet.clock
+            pyglet.clock.unschedule(self.tick)
+            self.scheduled = False
+
+    def close(self):
+        """Stops the loader and shuts down its worker processes."""
+        self.stop()
+        self.pool.close()
+        self.pool.join()
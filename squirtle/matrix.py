@@ -1,47 +1,113 @@
+import re
 import math
 import ctypes
+import numpy
 from parse import *
 
+_transform_re = re.compile(r'(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)')
+
+def _rotation(degrees):
+    a = math.radians(degrees)
+    c = math.cos(a)
+    s = math.sin(a)
+    return [c, s, -s, c, 0, 0]
+
+def parse_transform(string):
+    """Parses an SVG transform list, such as "translate(10) rotate(45 5 5)",
+    returning the values [a, b, c, d, e, f] of the combined transform. Unknown
+    or malformed transforms are ignored."""
+    result = Matrix()
+    for name, args in _transform_re.findall(string):
+        args = parse_numbers(args)
+        values = None
+        if name == 'matrix' and len(args) == 6:
+            values = args
+        elif name == 'translate' and len(args) in (1, 2):
+            values = [1, 0, 0, 1, args[0], args[1] if len(args) == 2 else 0]
+        elif name == 'scale' and len(args) in (1, 2):
+            values = [args[0], 0, 0, args[-1], 0, 0]
+        elif name == 'rotate' and len(args) == 1:
+            values = _rotation(args[0])
+        elif name == 'rotate' and len(args) == 3:
+            angle, cx, cy = args
+            result = result * Matrix([1, 0, 0, 1, cx, cy]) * Matrix(_rotation(angle))
+            values = [1, 0, 0, 1, -cx, -cy]
+        elif name == 'skewX' and len(args) == 1:
+            values = [1, 0, math.tan(math.radians(args[0])), 1, 0, 0]
+        elif name == 'skewY' and len(args) == 1:
+            values = [1, math.tan(math.radians(args[0])), 0, 1, 0, 0]
+        if values is not None:
+            result = result * Matrix(values)
+    return list(result.values)
+
 class Matrix(object):
+    """A 2D affine transform, stored as the tuple of six SVG matrix values 
+    (a, b, c, d, e, f).
+
+    The constructor accepts an SVG transform list, a sequence of six values or
+    None for the identity. A matrix maps single points when called, and arrays
+    of points with apply(). Composition and inversion use plain floats, which
+    are much quicker than NumPy for six values; only apply() uses NumPy.
+
+    """
     def __init__(self, string=None):
-        self.values = [1, 0, 0, 1, 0, 0] #Identity matrix seems a sensible default
-        if isinstance(string, str):
-            if string.startswith('matrix('):
-                self.values = [float(x) for x in parse_list(string[7:-1])]
-            elif string.startswith('translate('):
-                x, y = [float(x) for x in parse_list(string[10:-1])]
-                self.values = [1, 0, 0, 1, x, y]
-            elif string.startswith('scale('):
-                sx, sy = [float(x) for x in parse_list(string[6:-1])]
-                self.values = [sx, 0, 0, sy, 0, 0]           
+        if isinstance(string, basestring):
+            self.values = tuple(parse_transform(string))
         elif string is not None:
-            self.values = list(string)
-    
+            self.values = tuple(map(float, string))
+        else:
+            self.values = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0) #Identity matrix seems a sensible default
+
+    def __setstate__(self, state):
+        # Older pickles stored the values as a list
+        self.values = tuple(map(float, state['values']))
+
     def __call__(self, other):
-        return (self.values[0]*other[0] + self.values[2]*other[1] + self.values[4],
-                self.values[1]*other[0] + self.values[3]*other[1] + self.values[5])
-    
+        a, b, c, d, e, f = self.values
+        return (a*other[0] + c*other[1] + e,
+                b*other[0] + d*other[1] + f)
+
+    def apply(self, points):
+        """Applies the transform to an (n, 2) array of points, returning a new array.
+        Float32 input gives float32 output; anything else gives float64."""
+        points = numpy.asarray(points)
+        dtype = numpy.float32 if points.dtype == numpy.float32 else numpy.float64
+        points = points.reshape(-1, 2)
+        a, b, c, d, e, f = self.values
+        out = numpy.empty(points.shape, dtype=dtype)
+        out[:, 0] = a * points[:, 0] + c * points[:, 1] + e
+        out[:, 1] = b * points[:, 0] + d * points[:, 1] + f
+        return out
+
     def __str__(self):
-        return str(self.values)
-    
+        return str(list(self.values))
+
     def to_mat4(self):
         v = self.values
         return [v[0], v[1], 0.0, 0.0,
                 v[2], v[3], 0.0, 0.0,
                 0.0,  0.0,  1.0, 0.0,
                 v[4], v[5], 0.0, 1.0]
-    
+
     def inverse(self):
-        d = float(self.values[0]*self.values[3] - self.values[1]*self.values[2])
-        return Matrix([self.values[3]/d, -self.values[1]/d, -self.values[2]/d, self.values[0]/d,
-                       (self.values[2]*self.values[5] - self.values[3]*self.values[4])/d,
-                       (self.values[1]*self.values[4] - self.values[0]*self.values[5])/d])
+        a, b, c, d, e, f = self.values
+        det = float(a*d - b*c)
+        return _from_values((d/det, -b/det, -c/det, a/det,
+                             (c*f - d*e)/det,
+                             (b*e - a*f)/det))
 
     def __mul__(self, other):
         a, b, c, d, e, f = self.values
         u, v, w, x, y, z = other.values
-        return Matrix([a*u + c*v, b*u + d*v, a*w + c*x, b*w + d*x, a*y + c*z + e, b*y + d*z + f])
-        
+        return _from_values((a*u + c*v, b*u + d*v, a*w + c*x, b*w + d*x,
+                             a*y + c*z + e, b*y + d*z + f))
+
+def _from_values(values):
+    # Skips the conversions in __init__, for a tuple of six floats
+    matrix = Matrix.__new__(Matrix)
+    matrix.values = values
+    return matrix
+
 def svg_matrix_to_gl_matrix(matrix):
     v = matrix.values
     return [v[0], v[1], 0.0, v[2], v[3], 0.0, v[4], v[5], 1.0]
@@ -49,4 +115,4 @@ def svg_matrix_to_gl_matrix(matrix):
 def as_c_matrix(values):
     matrix_type = ctypes.c_float * len(values)
     matrix = matrix_type(*values)
-    return ctypes.cast(matrix, ctypes.POINTER(ctypes.c_float) )
\ No newline at end of file
+    return ctypes.cast(matrix, ctypes.POINTER(ctypes.c_float) )
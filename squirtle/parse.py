@@ -1,7 +1,109 @@
 import re
 
+NUMBER = r'[-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?'
+
+_list_re = re.compile('([A-Za-z]|%s)' % NUMBER)
+_number_re = re.compile(NUMBER)
+_next_number_re = re.compile(r'[\s,]*(%s)' % NUMBER)
+_next_flag_re = re.compile(r'[\s,]*([01])')
+_next_command_re = re.compile(r'[\s,]*([MmZzLlHhVvCcSsQqTtAa])')
+_trailing_re = re.compile(r'[\s,]*$')
+
+# Number of arguments taken by each path command
+PATH_ARGS = {'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4,
+             'Q': 4, 'T': 2, 'A': 7, 'Z': 0}
+
+#The SVG colour keywords, as hex RGB
+COLOR_KEYWORDS = {
+    'aliceblue': 'f0f8ff', 'antiquewhite': 'faebd7', 'aqua': '00ffff',
+    'aquamarine': '7fffd4', 'azure': 'f0ffff', 'beige': 'f5f5dc', 'bisque': 'ffe4c4',
+    'black': '000000', 'blanchedalmond': 'ffebcd', 'blue': '0000ff', 'blueviolet': '8a2be2',
+    'brown': 'a52a2a', 'burlywood': 'deb887', 'cadetblue': '5f9ea0', 'chartreuse': '7fff00',
+    'chocolate': 'd2691e', 'coral': 'ff7f50', 'cornflowerblue': '6495ed',
+    'cornsilk': 'fff8dc', 'crimson': 'dc143c', 'cyan': '00ffff', 'darkblue': '00008b',
+    'darkcyan': '008b8b', 'darkgoldenrod': 'b8860b', 'darkgray': 'a9a9a9',
+    'darkgreen': '006400', 'darkgrey': 'a9a9a9', 'darkkhaki': 'bdb76b',
+    'darkmagenta': '8b008b', 'darkolivegreen': '556b2f', 'darkorange': 'ff8c00',
+    'darkorchid': '9932cc', 'darkred': '8b0000', 'darksalmon': 'e9967a',
+    'darkseagreen': '8fbc8f', 'darkslateblue': '483d8b', 'darkslategray': '2f4f4f',
+    'darkslategrey': '2f4f4f', 'darkturquoise': '00ced1', 'darkviolet': '9400d3',
+    'deeppink': 'ff1493', 'deepskyblue': '00bfff', 'dimgray': '696969', 'dimgrey': '696969',
+    'dodgerblue': '1e90ff', 'firebrick': 'b22222', 'floralwhite': 'fffaf0',
+    'forestgreen': '228b22', 'fuchsia': 'ff00ff', 'gainsboro': 'dcdcdc',
+    'ghostwhite': 'f8f8ff', 'gold': 'ffd700', 'goldenrod': 'daa520', 'gray': '808080',
+    'grey': '808080', 'green': '008000', 'greenyellow': 'adff2f', 'honeydew': 'f0fff0',
+    'hotpink': 'ff69b4', 'indianred': 'cd5c5c', 'indigo': '4b0082', 'ivory': 'fffff0',
+    'khaki': 'f0e68c', 'lavender': 'e6e6fa', 'lavenderblush': 'fff0f5',
+    'lawngreen': '7cfc00', 'lemonchiffon': 'fffacd', 'lightblue': 'add8e6',
+    'lightcoral': 'f08080', 'lightcyan': 'e0ffff', 'lightgoldenrodyellow': 'fafad2',
+    'lightgray': 'd3d3d3', 'lightgreen': '90ee90', 'lightgrey': 'd3d3d3',
+    'lightpink': 'ffb6c1', 'lightsalmon': 'ffa07a', 'lightseagreen': '20b2aa',
+    'lightskyblue': '87cefa', 'lightslategray': '778899', 'lightslategrey': '778899',
+    'lightsteelblue': 'b0c4de', 'lightyellow': 'ffffe0', 'lime': '00ff00',
+    'limegreen': '32cd32', 'linen': 'faf0e6', 'magenta': 'ff00ff', 'maroon': '800000',
+    'mediumaquamarine': '66cdaa', 'mediumblue': '0000cd', 'mediumorchid': 'ba55d3',
+    'mediumpurple': '9370db', 'mediumseagreen': '3cb371', 'mediumslateblue': '7b68ee',
+    'mediumspringgreen': '00fa9a', 'mediumturquoise': '48d1cc', 'mediumvioletred': 'c71585',
+    'midnightblue': '191970', 'mintcream': 'f5fffa', 'mistyrose': 'ffe4e1',
+    'moccasin': 'ffe4b5', 'navajowhite': 'ffdead', 'navy': '000080', 'oldlace': 'fdf5e6',
+    'olive': '808000', 'olivedrab': '6b8e23', 'orange': 'ffa500', 'orangered': 'ff4500',
+    'orchid': 'da70d6', 'palegoldenrod': 'eee8aa', 'palegreen': '98fb98',
+    'paleturquoise': 'afeeee', 'palevioletred': 'db7093', 'papayawhip': 'ffefd5',
+    'peachpuff': 'ffdab9', 'peru': 'cd853f', 'pink': 'ffc0cb', 'plum': 'dda0dd',
+    'powderblue': 'b0e0e6', 'purple': '800080', 'red': 'ff0000', 'rosybrown': 'bc8f8f',
+    'royalblue': '4169e1', 'saddlebrown': '8b4513', 'salmon': 'fa8072',
+    'sandybrown': 'f4a460', 'seagreen': '2e8b57', 'seashell': 'fff5ee', 'sienna': 'a0522d',
+    'silver': 'c0c0c0', 'skyblue': '87ceeb', 'slateblue': '6a5acd', 'slategray': '708090',
+    'slategrey': '708090', 'snow': 'fffafa', 'springgreen': '00ff7f', 'steelblue': '4682b4',
+    'tan': 'd2b48c', 'teal': '008080', 'thistle': 'd8bfd8', 'tomato': 'ff6347',
+    'turquoise': '40e0d0', 'violet': 'ee82ee', 'wheat': 'f5deb3', 'white': 'ffffff',
+    'whitesmoke': 'f5f5f5', 'yellow': 'ffff00', 'yellowgreen': '9acd32'}
+
 def parse_list(string):
-    return re.findall("([A-Za-z]|-?[0-9]+\.?[0-9]*(?:e-?[0-9]*)?)", string)
+    return _list_re.findall(string)
+
+def parse_numbers(string):
+    """Returns the list of numbers in a comma and/or whitespace separated string."""
+    return [float(x) for x in _number_re.findall(string)]
+
+def parse_path(d):
+    """Scans SVG path data in a single pass, yielding (command, args) tuples.
+    
+    Implicitly repeated commands are yielded once per set of arguments, with 
+    coordinate pairs following a moveto yielded as lineto commands. The flags 
+    of elliptical arcs may be written without separators, e.g. 'a1 1 0 00 1 1'.
+    A ValueError is raised at the first malformed command, after yielding 
+    every command before it.
+    
+    """
+    pos = 0
+    command = None
+    while True:
+        m = _next_command_re.match(d, pos)
+        if m:
+            command = m.group(1)
+            pos = m.end()
+        elif _trailing_re.match(d, pos):
+            return
+        elif command is None or command in 'Zz':
+            raise ValueError("Bad path data at offset %d: %r" % (pos, d[pos:pos + 20]))
+        upper = command.upper()
+        args = []
+        for i in xrange(PATH_ARGS[upper]):
+            if upper == 'A' and i in (3, 4):
+                m = _next_flag_re.match(d, pos)
+            else:
+                m = _next_number_re.match(d, pos)
+            if not m:
+                raise ValueError("Expected %d arguments for '%s' at offset %d: %r" %
+                                 (PATH_ARGS[upper], command, pos, d[pos:pos + 20]))
+            args.append(float(m.group(1)))
+            pos = m.end()
+        yield command, tuple(args)
+        if command == 'M':
+            command = 'L'
+        elif command == 'm':
+            command = 'l'
 
 def parse_style(string):
     sdict = {}
@@ -12,11 +114,19 @@ def parse_style(string):
     return sdict
 
 
-def parse_color(c, default=None):
+def parse_color(c, default=None, strict=False):
+    """Parses an SVG paint: '#rrggbb', '#rgb' or a colour keyword such as 'red' 
+    gives an [r, g, b, a] list, 'url(#id)' the gradient id and 'none' None.
+    
+    An empty paint gives `default`. Any other paint prints a warning and gives 
+    None, or with strict=True raises ValueError.
+    
+    """
     if not c:
         return default
     if c == 'none':
         return None
+    c = COLOR_KEYWORDS.get(c.strip().lower(), c)
     if c[0] == '#': c = c[1:]
     if c.startswith('url(#'):
         return c[5:-1]
@@ -30,9 +140,11 @@ def parse_color(c, default=None):
             g = int(c[1], 16) * 17
             b = int(c[2], 16) * 17
         else:
-            raise Exception("Incorrect length for colour " + str(c) + " length " + str(len(c)))            
+            raise ValueError("Incorrect length for colour " + str(c) + " length " + str(len(c)))
         return [r,g,b,255]
-    except Exception, ex:
+    except ValueError, ex:
+        if strict:
+            raise ValueError("Invalid colour %r" % c)
         print 'Exception parsing color', ex
         return None
         
\ No newline at end of file
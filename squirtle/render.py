@@ -0,0 +1,556 @@
+"""OpenGL renderers which upload a Geometry and draw it.
+
+Each renderer takes a geometry.Geometry and exposes draw() and delete(), and
+`nbytes`, the approximate amount of GPU memory it uses.
+DisplayListRenderer compiles the geometry into a display list, while
+VBORenderer keeps it in a single interleaved vertex buffer object. Both draw
+the pre-transformed, merged batches built by compile_batches(), so drawing an
+SVG takes one glDrawArrays call per run of paths sharing the same state
+rather than several calls and matrix changes per path. TiledRenderer also
+groups the vertices into spatial tiles, and can draw only those in view.
+
+"""
+
+from ctypes import byref
+import numpy
+
+from gradient import stop_shader, get_atlas
+import shaders
+
+#OpenGL primitive modes, defined here so that compiling batches, which needs
+#no context, does not import pyglet.gl
+GL_LINES = 0x0001
+GL_TRIANGLES = 0x0004
+
+#Interleaved vertex layout: x, y, r, g, b, a as float32
+VERTEX_SIZE = 6
+VERTEX_STRIDE = VERTEX_SIZE * 4
+COLOR_OFFSET = 2 * 4
+
+
+class Batch(object):
+    """A run of consecutive vertices drawn with one glDrawArrays call.
+
+    `gradient` is the Gradient whose shader colours the run, or None for
+    vertex colours, and `transform` the path transform it was compiled
+    from, which the shader undoes to recover local coordinates.
+
+    """
+    __slots__ = ('mode', 'first', 'count', 'gradient', 'transform', 'key')
+
+    def __init__(self, mode, first, count, gradient, transform, key):
+        self.mode = mode
+        self.first = first
+        self.count = count
+        self.gradient = gradient
+        self.transform = transform
+        self.key = key
+
+def path_pieces(geometry, svgpath):
+    """Returns the (mode, vertices, colors, paint) pieces of `svgpath` in
+    drawing order, with its transform applied to the vertices. The vertices of
+    an invisible path are all collapsed to the origin. Lines carry the stroke
+    paint, which is the fill for antialiasing outlines, so gradient lines are
+    coloured by the shader like gradient triangles."""
+    tri_colors, line_colors = geometry.shader_colors()
+    tri_end = svgpath.tri_offset + svgpath.tri_count
+    stroke_end = svgpath.stroke_offset + svgpath.stroke_count
+    line_end = svgpath.line_offset + svgpath.line_count
+    if svgpath.fill == svgpath.stroke:
+        slices = [(GL_TRIANGLES, svgpath.tri_offset, stroke_end, svgpath.fill)]
+    else:
+        slices = [(GL_TRIANGLES, svgpath.tri_offset, tri_end, svgpath.fill),
+                  (GL_TRIANGLES, svgpath.stroke_offset, stroke_end, svgpath.stroke)]
+    slices.append((GL_LINES, svgpath.line_offset, line_end, svgpath.stroke))
+    pieces = []
+    for mode, start, end, paint in slices:
+        if end <= start:
+            continue
+        if mode == GL_LINES:
+            vertices, colors = geometry.line_vertices, line_colors
+        else:
+            vertices, colors = geometry.tri_vertices, tri_colors
+        if svgpath.visible:
+            vertices = svgpath.transform.apply(vertices[start:end])
+        else:
+            vertices = numpy.zeros((end - start, 2), dtype=numpy.float32)
+        pieces.append((mode, vertices, colors[start:end], paint))
+    return pieces
+
+def path_data(geometry, svgpath):
+    """Returns the interleaved rows which compile_batches() lays out for `svgpath`."""
+    pieces = path_pieces(geometry, svgpath)
+    if not pieces:
+        return numpy.zeros((0, VERTEX_SIZE), dtype=numpy.float32)
+    return numpy.hstack((numpy.concatenate([p[1] for p in pieces]),
+                         numpy.concatenate([p[2] for p in pieces]))).astype(numpy.float32)
+
+def compile_batches(geometry):
+    """Pre-transforms the vertices of `geometry` and merges consecutive paths
+    drawn with the same state into batches, preserving paint order.
+
+    Solid colour runs of the same primitive merge across paths; gradient runs
+    merge only when they share both the gradient and the path transform.
+    Returns an (n, VERTEX_SIZE) float32 array of interleaved positions and
+    colors in drawing order, and the list of Batches covering it. Each
+    SvgPath records where its vertices start in `data_offset`.
+
+    """
+    vertices = []
+    colors = []
+    batches = []
+    n = 0
+    for svgpath in geometry.paths:
+        svgpath.data_offset = n
+        for mode, verts, cols, paint in path_pieces(geometry, svgpath):
+            count = len(verts)
+            gradient = geometry.gradients[paint] if isinstance(paint, str) else None
+            if gradient is not None and not gradient.stops:
+                gradient = None
+            if gradient is None:
+                key = (mode, None)
+            else:
+                key = (mode, id(gradient), svgpath.transform.values)
+            vertices.append(verts)
+            colors.append(cols)
+            if batches and batches[-1].key == key:
+                batches[-1].count += count
+            else:
+                batches.append(Batch(mode, n, count, gradient, svgpath.transform, key))
+            n += count
+
+    if vertices:
+        data = numpy.hstack((numpy.concatenate(vertices), numpy.concatenate(colors)))
+    else:
+        data = numpy.zeros((0, VERTEX_SIZE))
+    return numpy.ascontiguousarray(data, dtype=numpy.float32), batches
+
+def acquire_ramps(batches):
+    """References the gradient atlas rows used by `batches`, returning the keys
+    to pass to release_ramps(). Renderers hold their rows so that the atlas
+    only reuses a row once nothing can draw with it."""
+    atlas = get_atlas()
+    return [atlas.acquire(batch.gradient) for batch in batches if batch.gradient is not None]
+
+def release_ramps(keys):
+    atlas = get_atlas()
+    for key in keys:
+        atlas.release(key)
+
+def draw_batches(batches, draw_arrays):
+    """Calls draw_arrays(mode, first, count) for each batch, binding the
+    gradient shader around gradient batches. Returns True if the shader was
+    used at all."""
+    shading = used = False
+    for batch in batches:
+        if batch.gradient is not None:
+            batch.gradient.apply_shader(batch.transform, pretransformed=True)
+            shading = used = True
+        elif shading:
+            stop_shader()
+            shading = False
+        draw_arrays(batch.mode, batch.first, batch.count)
+    if shading:
+        stop_shader()
+    return used
+
+
+class DisplayListRenderer(object):
+    """Compiles a Geometry's batches into an OpenGL display list."""
+
+    def __init__(self, geometry):
+        from pyglet import gl
+        import shader
+        self.geometry = geometry
+        self.data, self.batches = compile_batches(geometry)
+        self.ramps = acquire_ramps(self.batches)
+        self.nbytes = self.data.nbytes
+        self.disp_list = gl.glGenLists(1)
+        data = self.data
+        def draw_arrays(mode, first, count):
+            # Vertex arrays are dereferenced when the call is compiled into the
+            # list, so the data need not outlive this constructor
+            gl.glVertexPointer(2, gl.GL_FLOAT, VERTEX_STRIDE, data.ctypes.data + first * VERTEX_STRIDE)
+            gl.glColorPointer(4, gl.GL_FLOAT, VERTEX_STRIDE,
+                              data.ctypes.data + first * VERTEX_STRIDE + COLOR_OFFSET)
+            gl.glDrawArrays(mode, 0, count)
+        shader.begin_recording()
+        gl.glNewList(self.disp_list, gl.GL_COMPILE)
+        try:
+            gl.glPushClientAttrib(gl.GL_CLIENT_VERTEX_ARRAY_BIT)
+            gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+            gl.glEnableClientState(gl.GL_COLOR_ARRAY)
+            self.uses_shader = draw_batches(self.batches, draw_arrays)
+        finally:
+            # Close the list even if drawing failed, so later GL calls run normally
+            gl.glPopClientAttrib()
+            gl.glEndList()
+            shader.end_recording()
+
+    def draw(self):
+        from pyglet import gl
+        gl.glCallList(self.disp_list)
+        if self.uses_shader:
+            import shader
+            shader.invalidate_uniforms()
+
+    def delete(self):
+        from pyglet import gl
+        if self.disp_list:
+            gl.glDeleteLists(self.disp_list, 1)
+            self.disp_list = 0
+            release_ramps(self.ramps)
+            self.ramps = []
+
+
+class VBORenderer(object):
+    """Uploads a Geometry's batches into one interleaved vertex buffer object
+    and draws each batch with glDrawArrays.
+
+    With upload=False the buffer is only allocated, and the data must be sent
+    with one or more calls to upload() before drawing.
+
+    """
+
+    def __init__(self, geometry, upload=True):
+        from pyglet import gl
+        self.geometry = geometry
+        self.compile()
+        self.ramps = acquire_ramps(self.batches)
+        self.nbytes = self.data.nbytes
+        buf = gl.GLuint()
+        gl.glGenBuffers(1, byref(buf))
+        self.buffer = buf.value
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.buffer)
+        if upload:
+            gl.glBufferData(gl.GL_ARRAY_BUFFER, self.data.nbytes, self.data.ctypes.data, gl.GL_STATIC_DRAW)
+            self.uploaded = self.data.nbytes
+        else:
+            gl.glBufferData(gl.GL_ARRAY_BUFFER, self.data.nbytes, None, gl.GL_STATIC_DRAW)
+            self.uploaded = 0
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+    def upload(self, max_bytes=None):
+        """Sends up to `max_bytes` more of the vertex data to the buffer, or all of
+        the remainder if not given. Returns True once the whole buffer is uploaded."""
+        from pyglet import gl
+        remaining = self.data.nbytes - self.uploaded
+        if remaining > 0:
+            size = remaining if max_bytes is None else min(remaining, max_bytes)
+            gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.buffer)
+            gl.glBufferSubData(gl.GL_ARRAY_BUFFER, self.uploaded, size, self.data.ctypes.data + self.uploaded)
+            gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+            self.uploaded += size
+        return self.uploaded >= self.data.nbytes
+
+    def update_path(self, svgpath):
+        """Rewrites the vertices of `svgpath` after its colours, transform or
+        visibility have changed, uploading only its range of the buffer.
+
+        The change must not alter which batches the path belongs to, as happens
+        when a gradient is involved; call rebuild() instead in that case.
+
+        """
+        from pyglet import gl
+        rows = path_data(self.geometry, svgpath)
+        start = svgpath.data_offset
+        self.data[start:start + len(rows)] = rows
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.buffer)
+        gl.glBufferSubData(gl.GL_ARRAY_BUFFER, start * VERTEX_STRIDE, rows.nbytes,
+                           self.data.ctypes.data + start * VERTEX_STRIDE)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+    def compile(self):
+        self.data, self.batches = compile_batches(self.geometry)
+
+    def rebuild(self):
+        """Recompiles the batches from the geometry and uploads the whole buffer."""
+        from pyglet import gl
+        self.compile()
+        ramps = acquire_ramps(self.batches)
+        release_ramps(self.ramps)
+        self.ramps = ramps
+        self.nbytes = self.uploaded = self.data.nbytes
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.buffer)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, self.data.nbytes, self.data.ctypes.data, gl.GL_STATIC_DRAW)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+    def bind(self):
+        from pyglet import gl
+        gl.glPushClientAttrib(gl.GL_CLIENT_VERTEX_ARRAY_BIT)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.buffer)
+        gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glEnableClientState(gl.GL_COLOR_ARRAY)
+        gl.glVertexPointer(2, gl.GL_FLOAT, VERTEX_STRIDE, 0)
+        gl.glColorPointer(4, gl.GL_FLOAT, VERTEX_STRIDE, COLOR_OFFSET)
+
+    def unbind(self):
+        from pyglet import gl
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+        gl.glPopClientAttrib()
+
+    def draw(self):
+        from pyglet import gl
+        self.bind()
+        draw_batches(self.batches, gl.glDrawArrays)
+        self.unbind()
+
+    def delete(self):
+        from pyglet import gl
+        if self.buffer:
+            gl.glDeleteBuffers(1, byref(gl.GLuint(self.buffer)))
+            self.buffer = 0
+            release_ramps(self.ramps)
+            self.ramps = []
+
+
+class Tile(object):
+    """The vertices of a TiledRenderer lying in one tile of the grid.
+
+    `bounds` (min_x, min_y, max_x, max_y) encloses every primitive in the
+    tile, and `runs` is an (n, 3) array of (batch index, first, count) rows,
+    in drawing order.
+
+    """
+    __slots__ = ('bounds', 'runs')
+
+    def __init__(self, bounds, runs):
+        self.bounds = bounds
+        self.runs = runs
+
+class _Runs(object):
+    # Stands in for a Batch in draw_batches(), with arrays of firsts and counts
+    __slots__ = ('mode', 'first', 'count', 'gradient', 'transform')
+
+    def __init__(self, batch, firsts, counts):
+        from pyglet import gl
+        self.mode = batch.mode
+        self.gradient = batch.gradient
+        self.transform = batch.transform
+        self.first = (gl.GLint * len(firsts))(*firsts)
+        self.count = (gl.GLsizei * len(counts))(*counts)
+
+def _multi_draw_arrays(mode, first, count):
+    from pyglet import gl
+    gl.glMultiDrawArrays(mode, first, count, len(first))
+
+def compile_tiles(geometry, tile_size):
+    """Compiles `geometry` as compile_batches() does, then sorts the primitives
+    of each fill, stroke and line run of every path by the square tile of side
+    `tile_size` containing their centre, so that each tile's share of the
+    path is contiguous. Paint order between paths is unchanged.
+
+    Returns the data, the batches, a dict mapping (column, row) to Tiles and
+    the row order: data is compile_batches(geometry)[0][order].
+
+    """
+    data, batches = compile_batches(geometry)
+    order = numpy.arange(len(data))
+    batch_firsts = numpy.array([batch.first for batch in batches], dtype=numpy.int64)
+    runs = []
+    for svgpath in geometry.paths:
+        start = svgpath.data_offset
+        for count, size in ((svgpath.tri_count, 3), (svgpath.stroke_count, 3), (svgpath.line_count, 2)):
+            if not count:
+                continue
+            prims = data[start:start + count].reshape(-1, size, VERTEX_SIZE)
+            cells = numpy.floor(prims[:, :, :2].mean(axis=1) / tile_size).astype(numpy.int64)
+            sort = numpy.lexsort((cells[:, 1], cells[:, 0]))
+            prims = prims[sort]
+            cells = cells[sort]
+            data[start:start + count] = prims.reshape(-1, VERTEX_SIZE)
+            order[start:start + count] = order[start:start + count].reshape(-1, size)[sort].ravel()
+            # Each change of cell starts a new run
+            breaks = numpy.flatnonzero((cells[1:] != cells[:-1]).any(axis=1)) + 1
+            heads = numpy.concatenate(([0], breaks))
+            lows = numpy.minimum.reduceat(prims[:, :, :2].min(axis=1), heads)
+            highs = numpy.maximum.reduceat(prims[:, :, :2].max(axis=1), heads)
+            lengths = numpy.diff(numpy.concatenate((heads, [len(prims)])))
+            batch = numpy.searchsorted(batch_firsts, start, side='right') - 1
+            for head, length, low, high in zip(heads, lengths, lows, highs):
+                runs.append((tuple(cells[head]), batch, start + head * size, length * size, low, high))
+            start += count
+
+    grouped = {}
+    for cell, batch, first, count, low, high in runs:
+        grouped.setdefault(cell, []).append((batch, first, count, low, high))
+    tiles = {}
+    for cell, members in grouped.iteritems():
+        lows = numpy.array([m[3] for m in members])
+        highs = numpy.array([m[4] for m in members])
+        bounds = tuple(lows.min(axis=0).tolist()) + tuple(highs.max(axis=0).tolist())
+        tiles[cell] = Tile(bounds, numpy.array([m[:3] for m in members], dtype=numpy.int64))
+    return data, batches, tiles, order
+
+class TiledRenderer(VBORenderer):
+    """A VBORenderer whose primitives are grouped into square tiles of side
+    `tile_size`, so that draw() can skip the tiles outside a viewport.
+
+    Visible runs are drawn with glMultiDrawArrays, one call per batch. Paths
+    are never reordered, so overlapping shapes are painted as usual.
+
+    """
+
+    def __init__(self, geometry, tile_size, upload=True):
+        self.tile_size = tile_size
+        VBORenderer.__init__(self, geometry, upload)
+
+    def compile(self):
+        self.data, self.batches, self.tiles, self.order = compile_tiles(self.geometry,
+                                                                        self.tile_size)
+        # The transforms the tiles were built for
+        self.transforms = dict((id(svgpath), svgpath.transform.values)
+                               for svgpath in self.geometry.paths)
+
+    def update_path(self, svgpath):
+        """Rewrites the vertices of `svgpath` in the tile order they were compiled
+        in, uploading only its range of the buffer. A new transform may move the
+        path to other tiles, so the whole renderer is rebuilt in that case.
+
+        Hiding a path collapses its vertices in place, leaving the tiles as they
+        were.
+
+        """
+        if svgpath.transform.values != self.transforms.get(id(svgpath)):
+            self.rebuild()
+            return
+        from pyglet import gl
+        rows = path_data(self.geometry, svgpath)
+        start = svgpath.data_offset
+        end = start + len(rows)
+        self.data[start:end] = rows[self.order[start:end] - start]
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.buffer)
+        gl.glBufferSubData(gl.GL_ARRAY_BUFFER, start * VERTEX_STRIDE, rows.nbytes,
+                           self.data.ctypes.data + start * VERTEX_STRIDE)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+    def visible_runs(self, viewport):
+        """Returns stand-ins for the batches, each drawing only the runs in the
+        tiles intersecting `viewport`, (min_x, min_y, max_x, max_y)."""
+        x0, y0, x1, y1 = viewport
+        runs = [tile.runs for tile in self.tiles.itervalues()
+                if tile.bounds[0] <= x1 and tile.bounds[2] >= x0 and
+                   tile.bounds[1] <= y1 and tile.bounds[3] >= y0]
+        if not runs:
+            return []
+        runs = numpy.concatenate(runs)
+        runs = runs[numpy.argsort(runs[:, 1], kind='mergesort')]
+        # Merge runs which continue one another within a batch
+        joined = (runs[1:, 0] == runs[:-1, 0]) & (runs[1:, 1] == runs[:-1, 1] + runs[:-1, 2])
+        heads = numpy.flatnonzero(numpy.concatenate(([True], ~joined)))
+        ends = numpy.concatenate((heads[1:], [len(runs)]))
+        firsts = runs[heads, 1]
+        counts = (runs[ends - 1, 1] + runs[ends - 1, 2]) - firsts
+        batch_ids = runs[heads, 0]
+        result = []
+        bounds = numpy.flatnonzero(numpy.concatenate(([True], batch_ids[1:] != batch_ids[:-1])))
+        for start, end in zip(bounds, numpy.concatenate((bounds[1:], [len(batch_ids)]))):
+            result.append(_Runs(self.batches[batch_ids[start]],
+                                firsts[start:end].tolist(), counts[start:end].tolist()))
+        return result
+
+    def draw(self, viewport=None):
+        """Draws the tiles intersecting `viewport`, (min_x, min_y, max_x, max_y) in
+        the geometry's coordinates, or everything if it is None."""
+        if viewport is None:
+            VBORenderer.draw(self)
+            return
+        runs = self.visible_runs(viewport)
+        if runs:
+            self.bind()
+            draw_batches(runs, _multi_draw_arrays)
+            self.unbind()
+
+
+_instanced_program = None
+
+def get_instanced_program():
+    """Returns the shader program used by InstancedRenderer, compiling it on first use."""
+    global _instanced_program
+    if _instanced_program is None:
+        import shader
+        _instanced_program = shader.MakeProgramFromSource(shaders.instanced_vertex,
+                                                          shaders.color_fragment)
+        _instanced_program.stop()
+    return _instanced_program
+
+def pack_instances(xs, ys, angles=0, scales=1):
+    """Packs per-instance positions, angles (in degrees) and uniform scales
+    into an (n, 4) float32 array. Any argument may be a sequence, a NumPy
+    array, an array.array or a scalar shared by all instances."""
+    xs, ys, angles, scales = numpy.broadcast_arrays(*[numpy.asarray(v, dtype=numpy.float32)
+                                                      for v in (xs, ys, angles, scales)])
+    return numpy.ascontiguousarray(numpy.column_stack((xs.ravel(), ys.ravel(),
+                                                       angles.ravel(), scales.ravel())),
+                                   dtype=numpy.float32)
+
+class InstancedRenderer(object):
+    """Draws many copies of a Geometry with one instanced draw call per
+    primitive type (ARB_instanced_arrays and ARB_draw_instanced).
+
+    The geometry is stored pre-transformed, so gradients are drawn with their
+    per-vertex colors rather than the gradient shaders.
+
+    """
+
+    def __init__(self, geometry):
+        from pyglet import gl
+        self.geometry = geometry
+        tris, lines = geometry.world_vertices()
+        vertices = numpy.concatenate((tris, lines))
+        colors = numpy.concatenate((geometry.tri_colors, geometry.line_colors))
+        data = numpy.ascontiguousarray(numpy.hstack((vertices, colors)), dtype=numpy.float32)
+        self.nbytes = data.nbytes
+        self.n_tri_vertices = len(tris)
+        self.n_line_vertices = len(lines)
+        bufs = (gl.GLuint * 2)()
+        gl.glGenBuffers(2, bufs)
+        self.buffer, self.instance_buffer = bufs[0], bufs[1]
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.buffer)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, data.nbytes, data.ctypes.data, gl.GL_STATIC_DRAW)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+    def draw(self, instances, anchor_x=0, anchor_y=0):
+        """Draws one copy per row of the (n, 4) array built by pack_instances."""
+        from pyglet import gl
+        count = len(instances)
+        if not count:
+            return
+        program = get_instanced_program()
+        program.use()
+        program.uniformf("anchor", anchor_x, anchor_y)
+        loc = program.attribLocation("instance")
+
+        gl.glPushClientAttrib(gl.GL_CLIENT_VERTEX_ARRAY_BIT)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.instance_buffer)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, instances.nbytes, instances.ctypes.data, gl.GL_STREAM_DRAW)
+        gl.glEnableVertexAttribArrayARB(loc)
+        gl.glVertexAttribPointerARB(loc, 4, gl.GL_FLOAT, gl.GL_FALSE, 0, 0)
+        gl.glVertexAttribDivisorARB(loc, 1)
+
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.buffer)
+        gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glEnableClientState(gl.GL_COLOR_ARRAY)
+        gl.glVertexPointer(2, gl.GL_FLOAT, VERTEX_STRIDE, 0)
+        gl.glColorPointer(4, gl.GL_FLOAT, VERTEX_STRIDE, COLOR_OFFSET)
+        if self.n_tri_vertices:
+            gl.glDrawArraysInstancedARB(GL_TRIANGLES, 0, self.n_tri_vertices, count)
+        if self.n_line_vertices:
+            gl.glDrawArraysInstancedARB(GL_LINES, self.n_tri_vertices, self.n_line_vertices, count)
+
+        gl.glVertexAttribDivisorARB(loc, 0)
+        gl.glDisableVertexAttribArrayARB(loc)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+        gl.glPopClientAttrib()
+        program.stop()
+
+    def delete(self):
+        from pyglet import gl
+        if self.buffer:
+            gl.glDeleteBuffers(2, (gl.GLuint * 2)(self.buffer, self.instance_buffer))
+            self.buffer = self.instance_buffer = 0
+
+
+renderers = {'displaylist': DisplayListRenderer,
+             'vbo': VBORenderer,
+             'tiled': TiledRenderer}
@@ -0,0 +1,185 @@
+"""Bounded caches of the geometry and OpenGL resources shared between SVGs.
+
+Renderers (display lists and buffer objects) and tesselated geometry are
+shared between every SVG object loading the same file with the same options.
+Each SVG holds a reference to the entries it uses; when it is released, or
+garbage collected, the entries stay cached but may be evicted once the cache
+is over its budget, least recently used first. Evicting a renderer deletes
+its OpenGL objects.
+
+Example usage:
+    from squirtle import resources
+    resources.gpu_cache.set_budget(max_bytes=32 * 1024 * 1024)
+    my_svg.release()
+
+Garbage collection only drops references, since it may happen when no
+OpenGL context is current; the memory is freed by the next eviction, which
+runs whenever an entry is added or an SVG is released.
+
+"""
+
+import weakref
+from collections import OrderedDict
+
+
+class _Entry(object):
+    __slots__ = ('resource', 'size', 'refs')
+
+    def __init__(self, resource, size):
+        self.resource = resource
+        self.size = size
+        self.refs = 0
+
+
+def _delete(resource):
+    delete = getattr(resource, 'delete', None)
+    if delete is not None:
+        delete()
+
+
+class ResourceCache(object):
+    """An LRU cache of reference counted resources with a size budget.
+
+    `max_bytes` bounds the total size of the entries and `max_entries` their
+    number; either may be None for no limit. Only entries with no references
+    are evicted, so the cache may exceed its budget while they are in use.
+
+    """
+
+    def __init__(self, max_bytes=None, max_entries=None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.nbytes = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        """Returns the resource for `key`, marking it as most recently used."""
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return default
+        self.entries[key] = entry
+        return entry.resource
+
+    def add(self, key, resource, size=0):
+        """Stores `resource` under `key`, then evicts other entries if the cache
+        is over budget, and returns the resource now stored under `key`.
+
+        The cache owns the resources added to it. If a different resource is
+        already stored under `key` and referenced, it is kept and returned, and
+        `resource` is deleted instead; if it is unreferenced it is replaced and
+        deleted.
+
+        """
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            if entry.resource is not resource:
+                if entry.refs:
+                    self.entries[key] = entry
+                    _delete(resource)
+                    return entry.resource
+                _delete(entry.resource)
+            self.nbytes -= entry.size
+            entry.resource = resource
+            entry.size = size
+        else:
+            entry = _Entry(resource, size)
+        self.entries[key] = entry
+        self.nbytes += size
+        self.evict(keep=key)
+        return resource
+
+    def acquire(self, key):
+        """Adds a reference to the entry for `key`, protecting it from eviction."""
+        self.entries[key].refs += 1
+
+    def release(self, key):
+        """Drops a reference to the entry for `key`."""
+        entry = self.entries.get(key)
+        if entry is not None and entry.refs > 0:
+            entry.refs -= 1
+
+    def over_budget(self):
+        return ((self.max_bytes is not None and self.nbytes > self.max_bytes) or
+                (self.max_entries is not None and len(self.entries) > self.max_entries))
+
+    def evict(self, keep=None):
+        """Deletes unreferenced entries, least recently used first, until the
+        cache is within budget. The entry for `keep` is never evicted."""
+        if not self.over_budget():
+            return
+        for key in list(self.entries):
+            entry = self.entries[key]
+            if entry.refs or key == keep:
+                continue
+            self.remove(key)
+            if not self.over_budget():
+                break
+
+    def remove(self, key):
+        """Deletes the entry for `key` regardless of its references."""
+        entry = self.entries.pop(key)
+        self.nbytes -= entry.size
+        _delete(entry.resource)
+
+    def clear(self):
+        """Deletes every unreferenced entry."""
+        for key in list(self.entries):
+            if not self.entries[key].refs:
+                self.remove(key)
+
+    def set_budget(self, max_bytes=None, max_entries=None):
+        """Changes the budget, evicting entries if the cache is now over it."""
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.evict()
+
+
+#Renderers: display lists and vertex buffers
+gpu_cache = ResourceCache(max_bytes=64 * 1024 * 1024)
+
+#Tesselated Geometry objects
+geometry_cache = ResourceCache(max_bytes=128 * 1024 * 1024)
+
+
+_finalizers = set()
+
+class Holder(object):
+    """The cache entries referenced by one owner, such as an SVG.
+
+    The references are dropped by release(), or when the owner is garbage
+    collected.
+
+    """
+
+    def __init__(self, owner):
+        held = self.held = set()
+        def finalize(ref):
+            _finalizers.discard(ref)
+            for cache, key in held:
+                cache.release(key)
+            held.clear()
+        # Kept in a module-level set so the callback runs even if the owner
+        # dies as part of a reference cycle
+        _finalizers.add(weakref.ref(owner, finalize))
+
+    def hold(self, cache, key):
+        """References the entry for `key` in `cache`, if not already held."""
+        if (cache, key) not in self.held:
+            cache.acquire(key)
+            self.held.add((cache, key))
+
+    def release(self):
+        """Drops every reference held, then lets the caches evict."""
+        caches = set()
+        for cache, key in self.held:
+            cache.release(key)
+            caches.add(cache)
+        self.held.clear()
+        for cache in caches:
+            cache.evict()
@@ -1,9 +1,37 @@
 from pyglet.graphics import *
 from pyglet.gl import *
 import ctypes
+import weakref
 
 activeShader = None
 
+#While True, uniform values are sent even if unchanged; see begin_recording()
+recording = False
+
+_programs = weakref.WeakSet()
+
+def begin_recording():
+    """Call before compiling a display list which uses shaders.
+    
+    Commands compiled into a display list are not executed, so the cached 
+    uniform state cannot be trusted; every value used is recorded instead.
+    
+    """
+    global recording
+    recording = True
+
+def end_recording():
+    global recording
+    recording = False
+    invalidate_uniforms()
+
+def invalidate_uniforms():
+    """Marks every uniform of every program as needing to be sent again, e.g. 
+    after calling a display list which sets uniforms."""
+    for program in list(_programs):
+        for var in program.uniformVars.itervalues():
+            var.dirty = True
+
 class Shader(object):
     """An OpenGL shader object"""
     def __init__( self, shader_type, name="(unnamed shader)" ):
@@ -27,9 +55,9 @@ class Shader(object):
     
     def compileShader( self ):
         glCompileShader( self.shaderObject )
-        rval = ctypes.c_long()
-        glGetObjectParameterivARB (self.shaderObject, GL_OBJECT_COMPILE_STATUS_ARB, ctypes.pointer(rval))
-        if rval:
+        rval = GLint()
+        glGetObjectParameterivARB (self.shaderObject, GL_OBJECT_COMPILE_STATUS_ARB, ctypes.byref(rval))
+        if rval.value:
             print "%s compiled successfuly." % (self.name)
         else:
             print "Compile failed on shader %s: " % (self.name)
@@ -38,10 +66,10 @@ class Shader(object):
     
     def infoLog( self ):
         c = ctypes
-        infoLogLength = c.c_long()
+        infoLogLength = GLint()
         glGetObjectParameterivARB(self.shaderObject,
                                   GL_OBJECT_INFO_LOG_LENGTH_ARB,
-                                  ctypes.pointer(infoLogLength))
+                                  ctypes.byref(infoLogLength))
         buffer = c.create_string_buffer(infoLogLength.value)
         c_text = c.cast(c.pointer(buffer),
                         c.POINTER(GLchar)) 
@@ -52,20 +80,76 @@ class Shader(object):
         print self.infoLog()
 
 class UniformVar(object):
-    def __init__(self, set_function, name, *args ):
+    """A uniform value held by a Program, uploaded only when it has changed."""
+    def __init__(self, set_function, location, *args ):
         self.setFunction = set_function
-        self.name = name
+        self.location = location
         self.values = args
+        self.dirty = True
+    
+    def update(self, *args):
+        if args != self.values:
+            self.values = args
+            self.dirty = True
+    
+    def set(self):
+        if self.dirty or recording:
+            if self.location != -1:
+                self.setFunction( self.location, *self.values )
+            self.dirty = False
+
+class UniformMatrixVar(UniformVar):
+    """A matrix uniform, kept in a preallocated ctypes buffer."""
+    def __init__(self, set_function, location, transpose, values ):
+        self.setFunction = set_function
+        self.location = location
+        self.transpose = transpose
+        self.values = tuple(values)
+        self.buffer = (ctypes.c_float * len(values))(*values)
+        self.dirty = True
+    
+    def update(self, transpose, values):
+        values = tuple(values)
+        if values != self.values or transpose != self.transpose:
+            self.values = values
+            self.transpose = transpose
+            self.buffer[:] = values
+            self.dirty = True
     
     def set(self):
-        self.setFunction( self.name, *self.values )
+        if self.dirty or recording:
+            if self.location != -1:
+                self.setFunction( self.location, 1, self.transpose, self.buffer )
+            self.dirty = False
+
+_uniformi_functions = {1 : glUniform1iARB,
+                       2 : glUniform2iARB,
+                       3 : glUniform3iARB,
+                       4 : glUniform4iARB}
+
+_uniformf_functions = {1 : glUniform1fARB,
+                       2 : glUniform2fARB,
+                       3 : glUniform3fARB,
+                       4 : glUniform4fARB}
+
+_uniform_matrix_functions = {4 : glUniformMatrix2fvARB,
+                             9 : glUniformMatrix3fvARB,
+                             16 : glUniformMatrix4fvARB}
 
 class Program( object ):
-    """An OpenGL shader program"""
+    """An OpenGL shader program.
+    
+    Uniform locations are looked up once after linking, and uniform values are 
+    cached so that only those which have changed are sent to OpenGL. Values set 
+    while the program is not in use are sent the next time use() is called.
+    
+    """
     def __init__(self):
         self.programObject = glCreateProgramObjectARB()
         self.shaders = []
         self.uniformVars = {}
+        self.locations = {}
+        _programs.add(self)
     
     def __del__(self):
         glDeleteObjectARB( self.programObject) 
@@ -82,6 +166,33 @@ class Program( object ):
     
     def link( self ):
         glLinkProgramARB( self.programObject )
+        self.locations = {}
+        count = GLint()
+        glGetObjectParameterivARB( self.programObject, GL_OBJECT_ACTIVE_UNIFORMS_ARB, ctypes.byref(count) )
+        max_length = GLint()
+        glGetObjectParameterivARB( self.programObject, GL_OBJECT_ACTIVE_UNIFORM_MAX_LENGTH_ARB,
+                                   ctypes.byref(max_length) )
+        buff = ctypes.create_string_buffer(max(max_length.value, 1))
+        length = GLint()
+        size = GLint()
+        uniform_type = GLuint()
+        for i in xrange(count.value):
+            glGetActiveUniformARB( self.programObject, i, len(buff), ctypes.byref(length),
+                                   ctypes.byref(size), ctypes.byref(uniform_type), buff )
+            name = buff.value
+            self.locations[name] = glGetUniformLocationARB( self.programObject, name )
+        # Locations change on relinking, so every value must be sent again
+        for name, var in self.uniformVars.iteritems():
+            var.location = self.uniformLocation(name)
+            var.dirty = True
+    
+    def uniformLocation( self, name ):
+        """Returns the location of the uniform `name`, or -1 if it is not active."""
+        location = self.locations.get(name)
+        if location is None:
+            location = glGetUniformLocationARB( self.programObject, name )
+            self.locations[name] = location
+        return location
     
     def use( self ):
         global activeShader
@@ -95,49 +206,38 @@ class Program( object ):
         glUseProgramObjectARB( 0 )
         activeShader = None
     
+    def _uniform( self, functions, name, args ):
+        var = self.uniformVars.get(name)
+        if var is None:
+            var = UniformVar(functions[len(args)], self.uniformLocation(name), *args )
+            self.uniformVars[name] = var
+        else:
+            var.update(*args)
+        if self is activeShader:
+            var.set()
         
     def uniformi( self, name, *args ):
-        argf = {1 : glUniform1iARB,
-                2 : glUniform2iARB,
-                3 : glUniform3iARB,
-                4 : glUniform4iARB}
-        f = argf[len(args)]
-        def _set_uniform( name, *args ):
-            location = glGetUniformLocationARB( self.programObject, name )
-            f(location, *args)
-        self.uniformVars[name] = UniformVar(_set_uniform, name, *args )
-        if self == activeShader:
-            self.uniformVars[name].set()      
+        self._uniform( _uniformi_functions, name, args )
     
     def uniformf( self, name, *args ):
-        argf = {1 : glUniform1fARB,
-                2 : glUniform2fARB,
-                3 : glUniform3fARB,
-                4 : glUniform4fARB}
-        f = argf[len(args)]
-        def _set_uniform( name, *args ):
-            location = glGetUniformLocationARB( self.programObject, name )
-            f(location, *args)
-        self.uniformVars[name] = UniformVar(_set_uniform, name, *args )
-        if self == activeShader:
-            self.uniformVars[name].set()
+        self._uniform( _uniformf_functions, name, args )
     
     def uniformMatrixf(self, name, transpose, values):
-        argf = {4 : glUniformMatrix2fvARB,
-                9 : glUniformMatrix3fvARB,
-                16 : glUniformMatrix4fvARB}
-        f = argf[len(values)]
-        def _set_uniform( name, values ):
-            location = glGetUniformLocationARB( self.programObject, name )
-            matrix_type = ctypes.c_float * len(values)
-            matrix = matrix_type(*values)
-            f(location, 1, transpose, cast(matrix, ctypes.POINTER(ctypes.c_float) ))
-        self.uniformVars[name] = UniformVar(_set_uniform, name, values )
-        if self == activeShader:
-            self.uniformVars[name].set()
+        var = self.uniformVars.get(name)
+        if var is None:
+            var = UniformMatrixVar(_uniform_matrix_functions[len(values)],
+                                   self.uniformLocation(name), transpose, values )
+            self.uniformVars[name] = var
+        else:
+            var.update(transpose, values)
+        if self is activeShader:
+            var.set()
+    
+    def attribLocation(self, name):
+        return glGetAttribLocationARB( self.programObject, name )
     
     def setVars(self):
-        for name, var in self.uniformVars.iteritems():
+        for var in self.uniformVars.itervalues():
             var.set()
     
     def printInfoLog( self ):
@@ -11,116 +11,55 @@ void main()
 }"""
 
 
-radial = """
+gradient = """
 
-uniform vec2 center;
-uniform float radius;
+uniform sampler2D ramps;
+uniform float rampWidth;
+uniform float rampRow;
 
-uniform vec4 stops;
+uniform float kind;     // 0 for linear, 1 for radial
+uniform float spread;   // 0 for pad, 1 for reflect, 2 for repeat
+uniform vec4 geometry;  // linear: x1, y1, x2, y2; radial: cx, cy, r, unused
 
-uniform vec4 stop0;
-uniform vec4 stop1;
-uniform vec4 stop2;
-uniform vec4 stop3;
-uniform vec4 stop4;
-
-uniform mat3 worldTransform;
-uniform mat3 gradientTransform;
 uniform mat3 invGradientTransform;
 
 varying vec4 worldCoords;
-varying vec4 localCoords; 
+varying vec4 localCoords;
 
 void main()
 {
-    vec4 result;
-    
-    vec3 transformed = invGradientTransform*vec3(localCoords.x, localCoords.y, 1);
-    
-    //what is this actually doing?
-    vec3 realcenter = vec3(center.x, center.y, 1);
-
-    //calculate the intensity
-    float intensity = clamp(distance(transformed.xy, realcenter.xy) / radius, 0.0, 1.0 );
-    if(intensity <= stops.x)
-    {
-        result.rgba = mix(stop0, stop1, (intensity / stops.x));
-    }
-    else if(intensity <= stops.y)
-    {
-        result.rgba = mix(stop1, stop2, (intensity-stops.x) / (stops.y-stops.x));
-    }
-    else if(intensity <= stops.z)
-    {
-        result.rgba = mix(stop2, stop3, (intensity-stops.y) / (stops.z-stops.y));
-    }
-    else if(intensity <= stops.w)
-    {
-        result.rgba = mix(stop3, stop4, (intensity-stops.z) / (stops.w-stops.z));
-    }
-    else
-    {
-        result.rgba = stop4;
-    }
-
-    gl_FragColor = result;
-}"""
-
-linear = """
-
-uniform vec2 start;
-uniform vec2 end;
+    vec2 p = (invGradientTransform * vec3(localCoords.xy, 1.0)).xy;
 
-uniform float canvasHeight;
-uniform vec4 stops;
+    vec2 axis = geometry.zw - geometry.xy;
+    float linear_t = dot(p - geometry.xy, axis) / max(dot(axis, axis), 1e-12);
+    float radial_t = distance(p, geometry.xy) / max(geometry.z, 1e-12);
+    float t = mix(linear_t, radial_t, kind);
 
-uniform vec4 stop0;
-uniform vec4 stop1;
-uniform vec4 stop2;
-uniform vec4 stop3;
-uniform vec4 stop4;
+    vec3 spreads = vec3(clamp(t, 0.0, 1.0), 1.0 - abs(mod(t, 2.0) - 1.0), fract(t));
+    t = dot(spreads, vec3(equal(vec3(spread), vec3(0.0, 1.0, 2.0))));
 
-uniform mat3 worldTransform;
-uniform mat3 gradientTransform;
-uniform mat3 invGradientTransform;
+    //sample the centres of the first and last texels at t = 0 and t = 1
+    float u = (t * (rampWidth - 1.0) + 0.5) / rampWidth;
+    gl_FragColor = texture2D(ramps, vec2(u, rampRow));
+}"""
 
-varying vec4 worldCoords;
-varying vec4 localCoords; 
+instanced_vertex = """
+attribute vec4 instance; // x, y, angle in degrees, scale
+uniform vec2 anchor;
 
 void main()
 {
-    vec4 result;
-            
-    vec3 s = gradientTransform*vec3(start.x, start.y, 1);
-    vec3 d = gradientTransform*vec3(end.x, end.y, 1); 
-    vec3 l = localCoords.xyz;
-        
-    float num = (l.x - s.x)*(d.x - s.x) + (l.y - s.y)*(d.y - s.y);
-    float denom = pow(abs(s.x - d.x), 2.0) + pow(abs(s.y - d.y), 2.0);
-    float intensity =  clamp(num / denom, 0.0, 1.0);
+    float a = radians(instance.z);
+    float c = cos(a);
+    float s = sin(a);
+    vec2 p = (gl_Vertex.xy - anchor) * instance.w;
+    p = vec2(c * p.x - s * p.y, s * p.x + c * p.y) + instance.xy;
+    gl_FrontColor = gl_Color;
+    gl_Position = gl_ModelViewProjectionMatrix * vec4(p, 0.0, 1.0);
+}"""
 
-    //calculate the intensity
-    if(intensity <= stops.x)
-    {
-        result.rgba = mix(stop0, stop1, (intensity / stops.x));
-    }
-    else if(intensity <= stops.y)
-    {
-        result.rgba = mix(stop1, stop2, (intensity-stops.x) / (stops.y-stops.x));
-    }
-    else if(intensity <= stops.z)
-    {
-        result.rgba = mix(stop2, stop3, (intensity-stops.y) / (stops.z-stops.y));
-    }
-    else if(intensity <= stops.w)
-    {
-        result.rgba = mix(stop3, stop4, (intensity-stops.z) / (stops.w-stops.z));
-    }
-    else
-    {
-        result.rgba = stop4;
-    }
-    
-    gl_FragColor = result;
-}
-"""
\ No newline at end of file
+color_fragment = """
+void main()
+{
+    gl_FragColor = gl_Color;
+}"""
@@ -0,0 +1,118 @@
+"""Spatial index over the paths of a Geometry, for hit-testing.
+
+A SpatialIndex stores the bounding box of every path, with its transform
+applied, in a uniform grid covering the document. A point query looks up a
+single grid cell, rejects candidates by bounding box, and tests the
+triangles of the remaining paths exactly.
+
+Example usage:
+    from squirtle import geometry, spatial
+    index = spatial.SpatialIndex(geometry.load('map.svg'))
+    paths = index.query(120, 45)
+
+Only triangles are hit: fills, and strokes tesselated with
+strokes='triangles'. Strokes drawn as lines, and invisible paths, are never
+picked.
+
+"""
+
+import numpy
+
+#Average number of paths per grid cell to aim for
+PATHS_PER_CELL = 4
+
+#Paths whose bounding box covers more cells than this are kept in a list
+#checked by every query instead
+MAX_CELLS_PER_PATH = 1024
+
+
+def _contains(triangles, x, y):
+    # Triangles whose closed area contains (x, y), of either winding
+    a = triangles[:, 0]
+    b = triangles[:, 1]
+    c = triangles[:, 2]
+    d1 = (x - b[:, 0]) * (a[:, 1] - b[:, 1]) - (a[:, 0] - b[:, 0]) * (y - b[:, 1])
+    d2 = (x - c[:, 0]) * (b[:, 1] - c[:, 1]) - (b[:, 0] - c[:, 0]) * (y - c[:, 1])
+    d3 = (x - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (y - a[:, 1])
+    negative = (d1 < 0) | (d2 < 0) | (d3 < 0)
+    positive = (d1 > 0) | (d2 > 0) | (d3 > 0)
+    return ~(negative & positive)
+
+
+def _solid(triangles):
+    # Zero area triangles would contain every point on their line, or every
+    # point at all if their corners coincide
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+    return triangles[area != 0]
+
+
+class SpatialIndex(object):
+    """A uniform grid of the world-space bounding boxes of a Geometry's paths.
+
+    The index is a snapshot: build a new one after changing the transform or
+    visibility of a path. `cell_size` defaults to a size giving roughly
+    PATHS_PER_CELL paths per cell.
+
+    """
+
+    def __init__(self, geometry, cell_size=None):
+        self.geometry = geometry
+        tris, lines = geometry.world_vertices()
+        self.paths = []
+        self.triangles = []
+        boxes = []
+        for svgpath in geometry.paths:
+            count = svgpath.tri_count + svgpath.stroke_count
+            if not count or not svgpath.visible:
+                continue
+            triangles = tris[svgpath.tri_offset:svgpath.tri_offset + count].reshape(-1, 3, 2)
+            flat = triangles.reshape(-1, 2)
+            self.paths.append(svgpath)
+            self.triangles.append(_solid(triangles.astype(numpy.float64)))
+            boxes.append(numpy.concatenate((flat.min(axis=0), flat.max(axis=0))))
+        self.boxes = numpy.array(boxes, dtype=numpy.float64).reshape(-1, 4)
+        self.cells = {}
+        self.large = []
+        if not len(self.boxes):
+            self.origin = (0.0, 0.0)
+            self.cell_size = 1.0
+            return
+        x0, y0 = self.boxes[:, :2].min(axis=0)
+        x1, y1 = self.boxes[:, 2:].max(axis=0)
+        if cell_size is None:
+            n_cells = max(len(self.boxes) / float(PATHS_PER_CELL), 1.0)
+            # A document of only horizontal or vertical lines has no area, so the
+            # larger extent bounds the cell size from below
+            cell_size = max(numpy.sqrt((x1 - x0) * (y1 - y0) / n_cells),
+                            max(x1 - x0, y1 - y0) / n_cells, 1e-6)
+        self.origin = (float(x0), float(y0))
+        self.cell_size = float(cell_size)
+        cells = numpy.floor((self.boxes - [x0, y0, x0, y0]) / self.cell_size).astype(int)
+        for i, (cx0, cy0, cx1, cy1) in enumerate(cells.tolist()):
+            if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > MAX_CELLS_PER_PATH:
+                self.large.append(i)
+                continue
+            for cx in xrange(cx0, cx1 + 1):
+                for cy in xrange(cy0, cy1 + 1):
+                    self.cells.setdefault((cx, cy), []).append(i)
+
+    def candidates(self, x, y):
+        """Returns the indices of the paths whose bounding box contains (x, y)."""
+        cell = (int(numpy.floor((x - self.origin[0]) / self.cell_size)),
+                int(numpy.floor((y - self.origin[1]) / self.cell_size)))
+        result = []
+        indices = self.cells.get(cell, ())
+        if self.large:
+            indices = sorted(set(indices).union(self.large))
+        for i in indices:
+            x0, y0, x1, y1 = self.boxes[i]
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                result.append(i)
+        return result
+
+    def query(self, x, y):
+        """Returns the paths covering (x, y) in world coordinates, in paint order,
+        so the topmost path is last."""
+        return [self.paths[i] for i in self.candidates(x, y)
+                if _contains(self.triangles[i], x, y).any()]
@@ -0,0 +1,254 @@
+"""Raster sprite cache: SVGs rendered once into a texture and drawn as quads.
+
+Rasterizing every triangle of a complex SVG each frame is wasteful when it is
+drawn at a stable scale. A RasterSprite renders its SVG into a region of a
+shared SpriteAtlas texture through a framebuffer object (EXT_framebuffer_object),
+after which each draw is a single textured quad. The sprite is re-rendered
+whenever the draw scale strays outside a tolerance band around the scale it
+was rendered at.
+
+Example usage:
+    my_svg = squirtle.SVG('hud.svg', raster=True)
+    my_svg.draw(x, y, scale=2)
+
+Atlas space is handed out on shelves and is never freed piecemeal. When an
+atlas fills up it is cleared, and every sprite in it is re-rendered the next
+time it is drawn.
+
+"""
+
+import math
+from ctypes import byref
+
+
+ATLAS_SIZE = 2048
+PADDING = 2
+
+#Texels left empty between neighbouring regions, so filtering never bleeds
+GUTTER = 1
+
+
+class SpriteAtlas(object):
+    """An RGBA texture shared by many sprites, with shelf packing and the
+    framebuffer object used to render into it."""
+
+    def __init__(self, width=ATLAS_SIZE, height=ATLAS_SIZE):
+        from pyglet import gl
+        self.width = width
+        self.height = height
+        self.generation = 0
+        self.shelves = []
+        tex = gl.GLuint()
+        gl.glGenTextures(1, byref(tex))
+        self.texture = tex.value
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.texture)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP_TO_EDGE)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP_TO_EDGE)
+        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA8, width, height, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, None)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+        fbo = gl.GLuint()
+        gl.glGenFramebuffersEXT(1, byref(fbo))
+        self.framebuffer = fbo.value
+        self.bind()
+        gl.glFramebufferTexture2DEXT(gl.GL_FRAMEBUFFER_EXT, gl.GL_COLOR_ATTACHMENT0_EXT,
+                                     gl.GL_TEXTURE_2D, self.texture, 0)
+        status = gl.glCheckFramebufferStatusEXT(gl.GL_FRAMEBUFFER_EXT)
+        self.unbind()
+        if status != gl.GL_FRAMEBUFFER_COMPLETE_EXT:
+            self.delete()
+            raise Exception("Sprite atlas framebuffer is incomplete (status 0x%x)" % status)
+        self.clear()
+
+    def allocate(self, width, height):
+        """Reserves a `width` x `height` region, returning its (x, y) position, or
+        None if the atlas has no room left for it."""
+        width += GUTTER
+        height += GUTTER
+        if width > self.width or height > self.height:
+            return None
+        for shelf in self.shelves:
+            y, shelf_height, x = shelf
+            if height <= shelf_height and x + width <= self.width:
+                shelf[2] = x + width
+                return (x, y)
+        y = self.shelves[-1][0] + self.shelves[-1][1] if self.shelves else 0
+        if y + height > self.height:
+            return None
+        self.shelves.append([y, height, width])
+        return (0, y)
+
+    def fits(self, width, height):
+        """Returns True if a region of this size could ever be allocated."""
+        return width + GUTTER <= self.width and height + GUTTER <= self.height
+
+    def clear(self):
+        """Frees every region, invalidating the sprites rendered into them."""
+        from pyglet import gl
+        self.shelves = []
+        self.generation += 1
+        self.bind()
+        gl.glPushAttrib(gl.GL_COLOR_BUFFER_BIT | gl.GL_VIEWPORT_BIT)
+        gl.glViewport(0, 0, self.width, self.height)
+        gl.glClearColor(0, 0, 0, 0)
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+        gl.glPopAttrib()
+        self.unbind()
+
+    def bind(self):
+        from pyglet import gl
+        previous = gl.GLint()
+        gl.glGetIntegerv(gl.GL_FRAMEBUFFER_BINDING_EXT, byref(previous))
+        self._previous = previous.value
+        gl.glBindFramebufferEXT(gl.GL_FRAMEBUFFER_EXT, self.framebuffer)
+
+    def unbind(self):
+        from pyglet import gl
+        gl.glBindFramebufferEXT(gl.GL_FRAMEBUFFER_EXT, self._previous)
+
+    def delete(self):
+        from pyglet import gl
+        if self.framebuffer:
+            gl.glDeleteFramebuffersEXT(1, byref(gl.GLuint(self.framebuffer)))
+            self.framebuffer = 0
+        if self.texture:
+            gl.glDeleteTextures(1, byref(gl.GLuint(self.texture)))
+            self.texture = 0
+
+
+_atlas = None
+
+def get_atlas():
+    """Returns the default shared SpriteAtlas, creating it on first use."""
+    global _atlas
+    if _atlas is None:
+        _atlas = SpriteAtlas()
+    return _atlas
+
+
+class RasterSprite(object):
+    """Draws an SVG from a texture rendered at the current draw scale.
+
+    The texture is rendered at scale (sx, sy) and reused for draw scales within
+    a factor of 1 + `tolerance` of it on both axes. Sprites too large for the
+    atlas are drawn as vectors instead.
+
+    """
+
+    def __init__(self, svg, atlas=None, tolerance=0.25):
+        self.svg = svg
+        self.atlas = atlas
+        self.tolerance = tolerance
+        self.bounds = svg.geometry.bounds()
+        self.scale = None
+        self.generation = None
+        self.region = None
+
+    def invalidate(self):
+        """Forces the sprite to be rendered again the next time it is drawn."""
+        self.scale = None
+
+    def _needs_render(self, sx, sy):
+        if self.scale is None or self.generation != self.atlas.generation:
+            return True
+        limit = 1.0 + self.tolerance
+        for s, rendered in zip((sx, sy), self.scale):
+            ratio = s / rendered
+            if ratio > limit or ratio * limit < 1:
+                return True
+        return False
+
+    def render(self, sx, sy):
+        """Renders the SVG into the atlas at scale (sx, sy), which includes the
+        SVG's `lod_bias`. Returns False if it is too large to fit."""
+        from pyglet import gl
+        x0, y0, x1, y1 = self.bounds
+        w = int(math.ceil((x1 - x0) * sx)) + 2 * PADDING
+        h = int(math.ceil((y1 - y0) * sy)) + 2 * PADDING
+        atlas = self.atlas
+        if not atlas.fits(w, h):
+            self.scale = None
+            return False
+        pos = atlas.allocate(w, h)
+        if pos is None:
+            atlas.clear()
+            pos = atlas.allocate(w, h)
+        self.region = (pos[0], pos[1], w, h)
+        self.scale = (sx, sy)
+        self.generation = atlas.generation
+
+        atlas.bind()
+        gl.glPushAttrib(gl.GL_COLOR_BUFFER_BIT | gl.GL_VIEWPORT_BIT | gl.GL_SCISSOR_BIT | gl.GL_ENABLE_BIT)
+        gl.glViewport(pos[0], pos[1], w, h)
+        gl.glScissor(pos[0], pos[1], w, h)
+        gl.glEnable(gl.GL_SCISSOR_TEST)
+        gl.glClearColor(0, 0, 0, 0)
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+        gl.glDisable(gl.GL_DEPTH_TEST)
+        gl.glEnable(gl.GL_BLEND)
+        # Accumulate premultiplied alpha, so that the edges composite correctly
+        gl.glBlendFuncSeparate(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA, gl.GL_ONE, gl.GL_ONE_MINUS_SRC_ALPHA)
+        gl.glMatrixMode(gl.GL_PROJECTION)
+        gl.glPushMatrix()
+        gl.glLoadIdentity()
+        gl.glOrtho(0, w, 0, h, -1, 1)
+        gl.glMatrixMode(gl.GL_MODELVIEW)
+        gl.glPushMatrix()
+        gl.glLoadIdentity()
+        gl.glTranslatef(PADDING, PADDING, 0)
+        gl.glScalef(sx, sy, 1)
+        gl.glTranslatef(-x0, -y0, 0)
+        # (sx, sy) already includes lod_bias, which renderer_for() applies itself
+        bias = self.svg.lod_bias
+        self.svg.renderer_for((sx / bias, sy / bias)).draw()
+        gl.glPopMatrix()
+        gl.glMatrixMode(gl.GL_PROJECTION)
+        gl.glPopMatrix()
+        gl.glMatrixMode(gl.GL_MODELVIEW)
+        gl.glPopAttrib()
+        atlas.unbind()
+        return True
+
+    def draw(self, scale=1):
+        """Draws the sprite in the SVG's coordinate system under the current
+        modelview matrix, which should include a scale of `scale`. Returns False
+        if the SVG must be drawn as vectors instead."""
+        from pyglet import gl
+        try:
+            sx, sy = abs(scale[0]), abs(scale[1])
+        except TypeError:
+            sx = sy = abs(scale)
+        sx *= self.svg.lod_bias
+        sy *= self.svg.lod_bias
+        if not sx or not sy:
+            return True
+        if self.atlas is None:
+            self.atlas = get_atlas()
+        if self._needs_render(sx, sy) and not self.render(sx, sy):
+            return False
+
+        rx, ry, w, h = self.region
+        rsx, rsy = self.scale
+        aw = float(self.atlas.width)
+        ah = float(self.atlas.height)
+        x0 = self.bounds[0] - PADDING / rsx
+        y0 = self.bounds[1] - PADDING / rsy
+        x1 = x0 + w / rsx
+        y1 = y0 + h / rsy
+        u0, v0, u1, v1 = rx / aw, ry / ah, (rx + w) / aw, (ry + h) / ah
+
+        gl.glPushAttrib(gl.GL_ENABLE_BIT | gl.GL_COLOR_BUFFER_BIT | gl.GL_TEXTURE_BIT | gl.GL_CURRENT_BIT)
+        gl.glEnable(gl.GL_TEXTURE_2D)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.atlas.texture)
+        gl.glEnable(gl.GL_BLEND)
+        gl.glBlendFunc(gl.GL_ONE, gl.GL_ONE_MINUS_SRC_ALPHA)
+        gl.glColor4f(1, 1, 1, 1)
+        gl.glBegin(gl.GL_QUADS)
+        gl.glTexCoord2f(u0, v0); gl.glVertex2f(x0, y0)
+        gl.glTexCoord2f(u1, v0); gl.glVertex2f(x1, y0)
+        gl.glTexCoord2f(u1, v1); gl.glVertex2f(x1, y1)
+        gl.glTexCoord2f(u0, v1); gl.glVertex2f(x0, y1)
+        gl.glEnd()
+        gl.glPopAttrib()
+        return True
@@ -0,0 +1,234 @@
+"""Load statistics: time spent in each loading phase, and what was produced.
+
+Every SVG object has a LoadStats as its `stats` attribute, and the module
+level `totals` aggregates all of them. The phases are:
+
+    read         reading and decompressing the file
+    xml          parsing the XML
+    tokenize     scanning path data into commands
+    flatten      walking the document and flattening curves into lines
+    triangulate  triangulating fills and tesselating strokes
+    arrays       packing the paths into NumPy arrays
+    gradients    evaluating per-vertex gradient colours
+    cache        reading geometry from the on-disk cache
+    upload       building renderers, i.e. uploading to OpenGL
+
+Example usage:
+    from squirtle import stats
+    def log(load_stats, event, value):
+        print load_stats.name, event, value
+    stats.add_hook(log)
+    my_svg = squirtle.SVG('filename.svg')
+    print my_svg.stats.report()
+
+Hooks are called as hook(load_stats, phase, seconds) as each phase completes,
+and as hook(load_stats, 'loaded', load_stats) once an SVG is ready to draw.
+
+To find which elements of a document are slow to load, pass a Profile:
+
+    profile = stats.Profile()
+    my_svg = squirtle.SVG('slow.svg', profile=profile)
+    print profile.report(limit=10)
+
+"""
+
+import time
+
+PHASES = ('read', 'xml', 'tokenize', 'flatten', 'triangulate', 'arrays', 'gradients',
+          'cache', 'upload')
+
+COUNTS = ('paths', 'vertices', 'triangles', 'lines', 'draw_calls', 'bytes')
+
+_hooks = []
+
+
+class _Timer(object):
+    def __init__(self, stats, phase):
+        self.stats = stats
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, *exc_info):
+        self.stats.add_time(self.phase, time.time() - self.start)
+
+
+class LoadStats(object):
+    """The load statistics of one SVG, or of several when aggregated.
+
+    `times` maps each phase to the seconds spent in it. The counts, set once
+    an SVG is ready, describe its geometry and renderer: `paths`,
+    `vertices`, `triangles`, `lines`, `draw_calls` (per draw) and `bytes` (of
+    geometry arrays and GPU buffers).
+
+    With publish=False, as used in worker processes, times are only recorded
+    here; merging the object into another publishes them then.
+
+    """
+
+    def __init__(self, name=None, publish=True):
+        self.name = name
+        self.publish = publish
+        self.times = dict.fromkeys(PHASES, 0.0)
+        for count in COUNTS:
+            setattr(self, count, 0)
+        self.loaded = False
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['publish'] = False
+        return state
+
+    def add_time(self, phase, seconds):
+        """Adds `seconds` to `phase`, and to `totals`, then calls the hooks."""
+        self.times[phase] = self.times.get(phase, 0.0) + seconds
+        if self.publish and self is not totals:
+            totals.times[phase] = totals.times.get(phase, 0.0) + seconds
+            for hook in list(_hooks):
+                hook(self, phase, seconds)
+
+    def timer(self, phase):
+        """Returns a context manager which adds the time spent in it to `phase`."""
+        return _Timer(self, phase)
+
+    def merge(self, other):
+        """Adds the times of `other`, such as the stats of geometry loaded in
+        another process, to this object."""
+        for phase, seconds in sorted(other.times.iteritems()):
+            if seconds:
+                self.add_time(phase, seconds)
+
+    def count(self, geometry, renderer=None):
+        """Records the sizes of `geometry` and, if given, of the renderer drawing it."""
+        self.paths = len(geometry.paths)
+        self.vertices = len(geometry.tri_vertices) + len(geometry.line_vertices)
+        self.triangles = geometry.n_tris
+        self.lines = geometry.n_lines
+        self.bytes = geometry.nbytes
+        if renderer is not None:
+            self.bytes += renderer.nbytes
+            batches = getattr(renderer, 'batches', None)
+            self.draw_calls = len(batches) if batches is not None else 1
+
+    def finish(self):
+        """Marks the SVG as loaded, adding its counts to `totals` the first time,
+        and calls the hooks."""
+        if not self.publish:
+            return
+        if not self.loaded:
+            self.loaded = True
+            for count in COUNTS:
+                setattr(totals, count, getattr(totals, count) + getattr(self, count))
+        for hook in list(_hooks):
+            hook(self, 'loaded', self)
+
+    @property
+    def total_time(self):
+        return sum(self.times.itervalues())
+
+    def report(self):
+        """Returns a multi-line summary of the times and counts."""
+        lines = ['%s: %.4fs' % (self.name, self.total_time)]
+        for phase in PHASES:
+            if self.times.get(phase):
+                lines.append('  %-12s %.4fs' % (phase, self.times[phase]))
+        if self.paths:
+            lines.append('  ' + ', '.join('%s %d' % (count.replace('_', ' '), getattr(self, count))
+                                          for count in COUNTS))
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return '<LoadStats %s %.4fs>' % (self.name, self.total_time)
+
+
+#Aggregate of every SVG loaded in this process
+totals = LoadStats('total')
+
+def add_hook(hook):
+    """Registers hook(load_stats, event, value) to be called on every event."""
+    _hooks.append(hook)
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+def reset():
+    """Clears `totals`."""
+    totals.__init__('total')
+
+
+class ElementRecord(object):
+    """The load times of one element. `tokenize`, `flatten` and `triangulate`
+    exclude the element's children, which `total` includes. `vertices` is
+    the number of triangle and line vertices generated for the element."""
+    __slots__ = ('tag', 'id', 'index', 'tokenize', 'flatten', 'triangulate', 'total',
+                 'vertices')
+
+    def __init__(self, tag, element_id, index):
+        self.tag = tag
+        self.id = element_id
+        self.index = index
+        self.tokenize = self.flatten = self.triangulate = self.total = 0.0
+        self.vertices = 0
+
+    @property
+    def name(self):
+        return self.id or '%s #%d' % (self.tag, self.index)
+
+    @property
+    def self_time(self):
+        return self.tokenize + self.flatten + self.triangulate
+
+    def __repr__(self):
+        return '<ElementRecord %s %.4fs>' % (self.name, self.self_time)
+
+
+class Profile(object):
+    """Collects an ElementRecord for every element parsed, in document order.
+
+    Profiling is opt-in, as it adds timing calls to every element; pass a
+    Profile to geometry.load() or SVG(). Nothing is recorded for geometry read
+    from the on-disk cache or loaded in worker processes.
+
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def begin(self, tag, element_id):
+        """Returns a new ElementRecord for an element about to be parsed."""
+        if tag.startswith('{'):
+            tag = tag[tag.index('}') + 1:]
+        record = ElementRecord(tag, element_id, len(self.records))
+        self.records.append(record)
+        return record
+
+    def sorted(self, key='self_time'):
+        """Returns the records sorted by the attribute `key`, largest first."""
+        return sorted(self.records, key=lambda record: getattr(record, key), reverse=True)
+
+    def by_tag(self):
+        """Returns a dict mapping each tag to an ElementRecord summing the
+        self times and vertices of the elements with that tag."""
+        tags = {}
+        for record in self.records:
+            total = tags.get(record.tag)
+            if total is None:
+                total = tags[record.tag] = ElementRecord(record.tag, record.tag, 0)
+            total.tokenize += record.tokenize
+            total.flatten += record.flatten
+            total.triangulate += record.triangulate
+            total.total += record.self_time
+            total.vertices += record.vertices
+        return tags
+
+    def report(self, key='self_time', limit=20):
+        """Returns a table of the `limit` elements with the largest `key`, one of
+        'self_time', 'total', 'tokenize', 'flatten', 'triangulate' or 'vertices'."""
+        lines = ['%-32s %10s %10s %11s %10s %10s' % ('element', 'tokenize', 'flatten',
+                                                     'triangulate', 'total', 'vertices')]
+        for record in self.sorted(key)[:limit]:
+            lines.append('%-32s %10.4f %10.4f %11.4f %10.4f %10d' % (
+                record.name[:32], record.tokenize, record.flatten, record.triangulate,
+                record.total, record.vertices))
+        return '\n'.join(lines)
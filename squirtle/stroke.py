@@ -0,0 +1,139 @@
+"""Conversion of stroked paths into triangles.
+
+stroke_path() outlines the flattened loops of a path with a stroke of a given
+width, honouring the SVG stroke-linejoin ('miter', 'round' or 'bevel'),
+stroke-linecap ('butt', 'round' or 'square') and stroke-miterlimit
+properties. The result is a flat list of [x, y] vertices, three per
+triangle, in the same coordinates as the loops, so strokes can be drawn in
+the same batch as fills and need no glLineWidth support.
+
+Each segment, join and cap is emitted as separate triangles, which overlap
+slightly at the joins; translucent strokes therefore show faint seams.
+
+"""
+
+import math
+
+import flatten
+
+
+def _arc_steps(radius, angle, tolerance, circle_points):
+    if tolerance is not None:
+        return flatten.arc_segments(radius, angle, tolerance)
+    return max(int(math.ceil(circle_points * abs(angle) / (2 * math.pi))), 1)
+
+def _fan(tris, cx, cy, radius, start, sweep, steps):
+    # Triangles from the centre to an arc of `sweep` radians starting at `start`
+    px = cx + radius * math.cos(start)
+    py = cy + radius * math.sin(start)
+    for i in xrange(1, steps + 1):
+        theta = start + sweep * i / steps
+        x = cx + radius * math.cos(theta)
+        y = cy + radius * math.sin(theta)
+        tris.extend([[cx, cy], [px, py], [x, y]])
+        px, py = x, y
+
+def _direction(a, b):
+    dx = b[0] - a[0]
+    dy = b[1] - a[1]
+    length = math.sqrt(dx * dx + dy * dy)
+    return dx / length, dy / length
+
+def stroke_path(loops, width, join='miter', cap='butt', miter_limit=4.0,
+                tolerance=None, circle_points=24):
+    """Returns the triangles covering `loops`, a list of lists of [x, y]
+    points, stroked with the given width, join, cap and miter limit.
+
+    A loop whose last point equals its first is treated as closed and gets a
+    join there instead of caps. Round joins and caps are flattened within
+    `tolerance` if given, otherwise with `circle_points` segments per circle.
+
+    """
+    hw = width * 0.5
+    tris = []
+    if hw <= 0:
+        return tris
+    for loop in loops:
+        points = [p for i, p in enumerate(loop) if i == 0 or p != loop[i - 1]]
+        closed = len(points) > 2 and points[0] == points[-1]
+        if closed:
+            points = points[:-1]
+        if len(points) == 1:
+            x, y = points[0]
+            if cap == 'round':
+                _fan(tris, x, y, hw, 0, 2 * math.pi,
+                     _arc_steps(hw, 2 * math.pi, tolerance, circle_points))
+            elif cap == 'square':
+                tris.extend([[x - hw, y - hw], [x + hw, y - hw], [x + hw, y + hw],
+                             [x - hw, y - hw], [x + hw, y + hw], [x - hw, y + hw]])
+            continue
+        if len(points) < 2:
+            continue
+
+        n = len(points)
+        n_segments = n if closed else n - 1
+        dirs = [_direction(points[i], points[(i + 1) % n]) for i in xrange(n_segments)]
+
+        for i in xrange(n_segments):
+            ax, ay = points[i]
+            bx, by = points[(i + 1) % n]
+            dx, dy = dirs[i]
+            nx, ny = -dy * hw, dx * hw
+            tris.extend([[ax + nx, ay + ny], [ax - nx, ay - ny], [bx - nx, by - ny],
+                         [ax + nx, ay + ny], [bx - nx, by - ny], [bx + nx, by + ny]])
+
+        joins = xrange(n) if closed else xrange(1, n - 1)
+        for i in joins:
+            d0 = dirs[i - 1]
+            d1 = dirs[i % n_segments]
+            _join(tris, points[i], d0, d1, hw, join, miter_limit, tolerance, circle_points)
+
+        if not closed:
+            _cap(tris, points[0], dirs[0], hw, cap, -1, tolerance, circle_points)
+            _cap(tris, points[-1], dirs[-1], hw, cap, 1, tolerance, circle_points)
+    return tris
+
+def _join(tris, p, d0, d1, hw, join, miter_limit, tolerance, circle_points):
+    cross = d0[0] * d1[1] - d0[1] * d1[0]
+    dot = d0[0] * d1[0] + d0[1] * d1[1]
+    if abs(cross) < 1e-9 and dot > 0:
+        return
+    # The join fills the gap on the outer side of the turn
+    side = -1.0 if cross > 0 else 1.0
+    x, y = p
+    n0 = (-d0[1] * side, d0[0] * side)
+    n1 = (-d1[1] * side, d1[0] * side)
+    o0 = [x + n0[0] * hw, y + n0[1] * hw]
+    o1 = [x + n1[0] * hw, y + n1[1] * hw]
+    if join == 'round':
+        start = math.atan2(n0[1], n0[0])
+        sweep = math.atan2(n0[0] * n1[1] - n0[1] * n1[0], n0[0] * n1[0] + n0[1] * n1[1])
+        _fan(tris, x, y, hw, start, sweep, _arc_steps(hw, sweep, tolerance, circle_points))
+        return
+    if join == 'miter':
+        mx = n0[0] + n1[0]
+        my = n0[1] + n1[1]
+        length = math.sqrt(mx * mx + my * my)
+        if length > 1e-9:
+            mx /= length
+            my /= length
+            # Ratio of the miter length to the stroke width
+            cos_half = mx * n0[0] + my * n0[1]
+            if cos_half > 0 and 1.0 / cos_half <= miter_limit:
+                tip = [x + mx * hw / cos_half, y + my * hw / cos_half]
+                tris.extend([[x, y], o0, tip, [x, y], tip, o1])
+                return
+    tris.extend([[x, y], o0, o1])
+
+def _cap(tris, p, d, hw, cap, sign, tolerance, circle_points):
+    # `sign` is -1 for the start of a path and 1 for its end
+    x, y = p
+    dx, dy = d[0] * sign, d[1] * sign
+    nx, ny = -dy * hw, dx * hw
+    if cap == 'square':
+        ex, ey = x + dx * hw, y + dy * hw
+        tris.extend([[x + nx, y + ny], [x - nx, y - ny], [ex - nx, ey - ny],
+                     [x + nx, y + ny], [ex - nx, ey - ny], [ex + nx, ey + ny]])
+    elif cap == 'round':
+        start = math.atan2(-ny, -nx)
+        _fan(tris, x, y, hw, start, math.pi, _arc_steps(hw, math.pi, tolerance, circle_points))
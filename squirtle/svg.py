@@ -7,87 +7,58 @@ Example usage:
     
 """
 
-from pyglet.gl import *
-try:
-    import xml.etree.ElementTree
-    from xml.etree.cElementTree import parse
-except:
-    import elementtree.ElementTree
-    from elementtree.ElementTree import parse
-import re
+import copy
 import math
-from ctypes import CFUNCTYPE, POINTER, byref, cast, c_char_p
-import sys
-import string
-import shader
-import ctypes
+import numpy
 
 from matrix import *
 from parse import *
 from gradient import *
+from geometry import SvgPath, TriangulationError, Geometry, BEZIER_POINTS, CIRCLE_POINTS
+from cache import load_geometry
+from render import renderers, InstancedRenderer, VBORenderer, TiledRenderer, pack_instances
+from sprite import RasterSprite
+from spatial import SpatialIndex
+from stats import LoadStats
+import resources
 
-print  cast(glGetString(GL_SHADING_LANGUAGE_VERSION), c_char_p).value
+LOD_TOLERANCE = 0.5
 
-tess = gluNewTess()
-gluTessNormal(tess, 0, 0, 1)
-gluTessProperty(tess, GLU_TESS_WINDING_RULE, GLU_TESS_WINDING_NONZERO)
-
-if sys.platform == 'win32':
-    from ctypes import WINFUNCTYPE
-    c_functype = WINFUNCTYPE
-else:
-    c_functype = CFUNCTYPE
-    
-callback_types = {GLU_TESS_VERTEX: c_functype(None, POINTER(GLvoid)),
-                  GLU_TESS_BEGIN: c_functype(None, GLenum),
-                  GLU_TESS_END: c_functype(None),
-                  GLU_TESS_ERROR: c_functype(None, GLenum),
-                  GLU_TESS_COMBINE: c_functype(None, POINTER(GLdouble), POINTER(POINTER(GLvoid)), POINTER(GLfloat), POINTER(POINTER(GLvoid)))}
-
-def set_tess_callback(which):
-    def set_call(func):
-        cb = callback_types[which](func)
-        gluTessCallback(tess, which, cast(cb, CFUNCTYPE(None)))
-        return cb
-    return set_call
-    
-BEZIER_POINTS = 20
-CIRCLE_POINTS = 24
-TOLERANCE = 0.001
-
-xmlns = 'http://www.w3.org/2000/svg'
+#Default side of the square tiles used with mode='tiled', in SVG units
+TILE_SIZE = 256
 
 def setup_gl():
     """Set various pieces of OpenGL state for better rendering of SVG.
     
     """
-    glEnable(GL_LINE_SMOOTH)
-    glEnable(GL_BLEND)
-    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-
+    from pyglet import gl
+    gl.glEnable(gl.GL_LINE_SMOOTH)
+    gl.glEnable(gl.GL_BLEND)
+    gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
 
-class SvgPath(object):
-    def __init__(self, path, stroke, polygon, fill, transform, path_id, title, desc):
-        
-        self.path = list(path) if path else []
-        self.stroke = stroke
-        self.polygon = polygon
-        self.fill = fill
-        self.transform = Matrix(transform.values)
-        self.id = path_id
-        self.title = title
-        self.description = desc
-        print "PATH", self.path
-        
-        
-    def __repr__(self):
-        return "<SvgPath id=%s title='%s' description='%s' transform=%s>" %(
-            self.id, self.title, self.description, self.transform
-        )
-                               
-class TriangulationError(Exception):
-    """Exception raised when triangulation of a filled area fails. For internal use only."""
-    pass
+def view_bounds():
+    """Returns the bounding box (min_x, min_y, max_x, max_y), in the coordinates of 
+    the current modelview matrix at z=0, of the area visible through the current 
+    projection, or None if it cannot be found."""
+    from pyglet import gl
+    modelview = (gl.GLdouble * 16)()
+    projection = (gl.GLdouble * 16)()
+    gl.glGetDoublev(gl.GL_MODELVIEW_MATRIX, modelview)
+    gl.glGetDoublev(gl.GL_PROJECTION_MATRIX, projection)
+    m = numpy.dot(numpy.array(projection).reshape(4, 4).T, numpy.array(modelview).reshape(4, 4).T)
+    corners = []
+    for nx, ny in ((-1, -1), (1, -1), (1, 1), (-1, 1)):
+        # Solve for the point on the z=0 plane which projects to (nx, ny)
+        a = numpy.array([[m[0, 0] - nx * m[3, 0], m[0, 1] - nx * m[3, 1]],
+                         [m[1, 0] - ny * m[3, 0], m[1, 1] - ny * m[3, 1]]])
+        b = numpy.array([nx * m[3, 3] - m[0, 3], ny * m[3, 3] - m[1, 3]])
+        try:
+            corners.append(numpy.linalg.solve(a, b))
+        except numpy.linalg.LinAlgError:
+            return None
+    low = numpy.min(corners, axis=0)
+    high = numpy.max(corners, axis=0)
+    return (float(low[0]), float(low[1]), float(high[0]), float(high[1]))
 
 class SVG(object):
     """Opaque SVG image object.
@@ -97,8 +68,10 @@ class SVG(object):
     
     """
     
-    _disp_list_cache = {}
-    def __init__(self, filename, anchor_x=0, anchor_y=0, bezier_points=BEZIER_POINTS, circle_points=CIRCLE_POINTS, invert_y=False):
+    _disp_list_cache = resources.gpu_cache
+    def __init__(self, filename, anchor_x=0, anchor_y=0, bezier_points=BEZIER_POINTS, circle_points=CIRCLE_POINTS, invert_y=False, mode='displaylist', cache_dir=None,
+                 tolerance=None, lod_scales=None, triangulator='glu', defer=False, raster=False, raster_tolerance=0.25,
+                 atlas=None, strokes='lines', tile_size=TILE_SIZE, profile=None):
         """Creates an SVG object from a .svg or .svgz file.
         
             `filename`: str
@@ -114,22 +87,84 @@ class SVG(object):
             `circle_points`: int
                 The number of line segments into which to subdivide circular and elliptic arcs. 
                 Defaults to 10.
+            `tolerance`: float
+                If given, curves and arcs are subdivided adaptively so that they stray no further 
+                than this many units from the true shape, and bezier_points and circle_points 
+                are ignored. Divide a screen-space tolerance by the intended draw scale.
+            `triangulator`: str
+                The triangulation backend: 'glu' (the default) uses the GLU tesselator, 
+                'python' a pure Python sweep-line triangulator which needs no OpenGL.
+            `strokes`: str
+                'lines' (the default) draws strokes as one pixel wide lines, and outlines fills 
+                with lines for antialiasing. 'triangles' tesselates strokes with their real 
+                width, joins and caps, and draws everything as triangles.
+            `mode`: str
+                How the geometry is stored on the GPU: 'displaylist' (the default) compiles it 
+                into a display list, 'vbo' uploads it into an interleaved vertex buffer object. 
+                'tiled' also groups the vertices into square tiles, so that draw() given a 
+                viewport draws only the tiles in view.
+            `tile_size`: float
+                The side of the tiles used with mode='tiled', in SVG units. Defaults to 256.
+            `cache_dir`: str
+                A directory in which to keep tesselated geometry between runs. Entries are keyed 
+                by the file's contents and all options affecting tesselation. Defaults to None, 
+                which disables the on-disk cache.
+            `lod_scales`: sequence of float
+                Draw scales at which to build levels of detail, e.g. (0.25, 0.5, 1, 2). Each 
+                level is tesselated on first use with the tolerance divided by its scale (using 
+                LOD_TOLERANCE if no tolerance is given), and draw() uses the smallest level at 
+                least as large as the effective scale. Defaults to None, which uses a single 
+                tesselation at every scale.
+            `raster`: bool
+                If True, draw() renders the SVG into a texture in a shared sprite atlas and 
+                draws it as a single textured quad, re-rendering it when the draw scale changes 
+                by more than a factor of 1 + raster_tolerance. Defaults to False.
+            `raster_tolerance`: float
+                How far the draw scale may stray from the rendered scale before a raster 
+                sprite is re-rendered. Defaults to 0.25.
+            `atlas`: sprite.SpriteAtlas
+                The atlas holding the raster sprite. Defaults to a shared atlas.
+            `profile`: stats.Profile
+                If given, the load time and vertex count of every element are recorded in it 
+                whenever the file is tesselated in this process. Defaults to None.
+            `defer`: bool
+                If True, the file is not loaded until generate_disp_list() or set_geometry() 
+                is called, and `ready` stays False until then. Defaults to False.
                 
         """
-        self.path_lookup = {}
-        self.paths = []
         self.invert_y = invert_y
         self.filename = filename
         self.bezier_points = bezier_points
         self.circle_points = circle_points
-        self.bezier_coefficients = []
-        self.gradients = GradientContainer()
-        self.generate_disp_list()
+        self.tolerance = tolerance
+        self.triangulator = triangulator
+        self.strokes = strokes
+        self.mode = mode
+        self.tile_size = tile_size
+        self.cache_dir = cache_dir
+        self.lod_scales = sorted(lod_scales) if lod_scales else None
+        self.lod_bias = 1.0
+        self.raster = raster
+        self.raster_tolerance = raster_tolerance
+        self.atlas = atlas
+        self.sprite = None
+        self._resources = resources.Holder(self)
+        self.stats = LoadStats(filename)
+        self.profile = profile
+        self._edited = None
+        self._index = None
+        self.ready = False
+        self._a_x = self._a_y = 0
         self.anchor_x = anchor_x
         self.anchor_y = anchor_y
+        if not defer:
+            self.generate_disp_list()
 
     def _set_anchor_x(self, anchor_x):
         self._anchor_x = anchor_x
+        if not self.ready:
+            # Symbolic anchors are resolved once the size is known
+            return
         if self._anchor_x == 'left':
             self._a_x = 0
         elif self._anchor_x == 'center':
@@ -146,6 +181,8 @@ class SVG(object):
     
     def _set_anchor_y(self, anchor_y):
         self._anchor_y = anchor_y
+        if not self.ready:
+            return
         if self._anchor_y == 'bottom':
             self._a_y = 0
         elif self._anchor_y == 'center':
@@ -160,24 +197,303 @@ class SVG(object):
         
     anchor_y = property(_get_anchor_y, _set_anchor_y)
     
-    def generate_disp_list(self):
-        if (self.filename, self.bezier_points) in self._disp_list_cache:
-            self.disp_list, self.width, self.height = self._disp_list_cache[self.filename, self.bezier_points]
-        else:
-            if open(self.filename, 'rb').read(3) == '\x1f\x8b\x08': #gzip magic numbers
-                import gzip
-                f = gzip.open(self.filename, 'rb')
+    _geometry_cache = resources.geometry_cache
+
+    def geometry_options(self, lod_scale=None):
+        """Returns the keyword arguments for geometry.load() which affect tesselation,
+        for the level of detail `lod_scale` if given."""
+        options = {'bezier_points': self.bezier_points,
+                   'circle_points': self.circle_points,
+                   'invert_y': self.invert_y,
+                   'tolerance': self.tolerance,
+                   'triangulator': self.triangulator,
+                   'strokes': self.strokes}
+        if lod_scale is not None:
+            options['tolerance'] = (self.tolerance or LOD_TOLERANCE) / float(lod_scale)
+        return options
+
+    def _cache_key(self, options, *extra):
+        return (self.filename, tuple(sorted(options.items()))) + extra
+
+    def get_geometry(self, lod_scale=None):
+        """Returns the Geometry for the level of detail `lod_scale`, loading it if needed."""
+        options = self.geometry_options(lod_scale)
+        key = self._cache_key(options)
+        geometry = self._geometry_cache.get(key)
+        if geometry is None:
+            geometry = load_geometry(self.filename, self.cache_dir, self.stats, self.profile, **options)
+            self._geometry_cache.add(key, geometry, geometry.nbytes)
+        self._resources.hold(self._geometry_cache, key)
+        return geometry
+
+    def has_geometry(self, lod_scale=None):
+        """Returns True if the Geometry for the level of detail `lod_scale` is already loaded."""
+        return self._cache_key(self.geometry_options(lod_scale)) in self._geometry_cache
+
+    def set_geometry(self, geometry, lod_scale=None):
+        """Supplies an already loaded Geometry, such as one built in another process, 
+        for the level of detail `lod_scale`. Call generate_disp_list() afterwards to 
+        upload it."""
+        if geometry.stats is not None and not geometry.stats.publish:
+            # Loaded elsewhere, so its times have not been recorded yet
+            self.stats.merge(geometry.stats)
+            geometry.stats = self.stats
+        key = self._cache_key(self.geometry_options(lod_scale))
+        self._geometry_cache.add(key, geometry, geometry.nbytes)
+        self._resources.hold(self._geometry_cache, key)
+
+    def _renderer_key(self, lod_scale, kind):
+        if kind == 'tiled':
+            return self._cache_key(self.geometry_options(lod_scale), kind, self.tile_size)
+        return self._cache_key(self.geometry_options(lod_scale), kind)
+
+    def set_renderer(self, renderer, lod_scale=None, kind=None):
+        """Supplies an already created renderer of type `kind` (defaulting to the SVG's 
+        mode) for the level of detail `lod_scale`. If another SVG already uses a 
+        renderer for it, that one is kept and `renderer` is deleted."""
+        key = self._renderer_key(lod_scale, kind or self.mode)
+        self._disp_list_cache.add(key, renderer, renderer.nbytes)
+        self._resources.hold(self._disp_list_cache, key)
+
+    def has_renderer(self, lod_scale=None, kind=None):
+        """Returns True if the renderer of type `kind` (defaulting to the SVG's mode) 
+        for the level of detail `lod_scale` already exists."""
+        return self._renderer_key(lod_scale, kind or self.mode) in self._disp_list_cache
+
+    def get_renderer(self, lod_scale=None, kind=None):
+        """Returns the renderer of type `kind` (defaulting to the SVG's mode) for the 
+        level of detail `lod_scale`, creating it if needed."""
+        kind = kind or self.mode
+        key = self._renderer_key(lod_scale, kind)
+        renderer = self._disp_list_cache.get(key)
+        if renderer is None:
+            geometry = self.get_geometry(lod_scale)
+            with self.stats.timer('upload'):
+                if kind == 'instanced':
+                    renderer = InstancedRenderer(geometry)
+                elif kind == 'tiled':
+                    renderer = TiledRenderer(geometry, self.tile_size)
+                else:
+                    renderer = renderers[kind](geometry)
+            self._disp_list_cache.add(key, renderer, renderer.nbytes)
+        self._resources.hold(self._disp_list_cache, key)
+        return renderer
+
+    def release(self):
+        """Releases the geometry and OpenGL resources used by this SVG, which may 
+        then be evicted from the shared caches (see resources.py). The SVG is no 
+        longer `ready` and draws nothing until generate_disp_list() is called again.
+        
+        """
+        self.ready = False
+        self.renderer = self.geometry = self.disp_list = self.sprite = None
+        self._index = None
+        if self._edited is not None:
+            self._edited.delete()
+            self._edited = None
+        self._resources.release()
+
+    def renderer_for(self, scale=1):
+        """Returns the renderer used to draw at `scale`: the edited copy if any 
+        path has been changed, otherwise the level of detail for the scale."""
+        if self._edited is not None:
+            return self._edited
+        if self.lod_scales:
+            return self.get_renderer(self.select_lod(scale))
+        return self.renderer
+
+    def _editable(self):
+        # The shared geometry is never modified; the first edit gives this SVG 
+        # its own copy of the paths and colours, drawn from a private VBO, which 
+        # is tiled for tiled documents so that culling still applies
+        if self._edited is None:
+            geometry = self.geometry
+            paths = [copy.copy(svgpath) for svgpath in geometry.paths]
+            tri_colors, line_colors = geometry.shader_colors()
+            edited = Geometry.from_arrays(geometry.width, geometry.height, paths, geometry.gradients,
+                                          geometry.tri_vertices, tri_colors.copy(),
+                                          geometry.line_vertices, line_colors.copy())
+            if self.mode == 'tiled':
+                self._edited = TiledRenderer(edited, self.tile_size)
             else:
-                f = open(self.filename, 'rb')
-            self.tree = parse(f)
-            self.parse_doc()
-            self.disp_list = glGenLists(1)
-            glNewList(self.disp_list, GL_COMPILE)
-            self.render_slowly()
-            glEndList()
-            self._disp_list_cache[self.filename, self.bezier_points] = (self.disp_list, self.width, self.height)
-
-    def draw(self, x, y, z=0, angle=0, scale=1):
+                self._edited = VBORenderer(edited)
+            self.paths = edited.paths
+            self.path_lookup = edited.path_lookup
+        return self._edited
+
+    def _update_path(self, svgpath, rebuild):
+        if rebuild:
+            self._edited.rebuild()
+        else:
+            self._edited.update_path(svgpath)
+        self._index = None
+        if self.sprite:
+            self.sprite.invalidate()
+
+    def set_fill(self, path_id, color):
+        """Changes the fill of the path with id `path_id`.
+        
+        :Parameters
+            `path_id` : str
+                The id of the path.
+            `color` : str or sequence
+                An SVG colour such as '#ff8000' or 'red', 'none', the id of a gradient 
+                in the document, or an (r, g, b, a) sequence of values from 0 to 255.
+        
+        Raises ValueError for a colour which cannot be parsed, or for a path with 
+        no fill triangles, such as one loaded with fill 'none', and KeyError for 
+        an unknown gradient.
+        
+        Only the path's vertices are uploaded again, unless a gradient is involved, 
+        or set_transform() is used with mode='tiled'. 
+        Edits apply to this SVG object alone; it is drawn from its own vertex buffer 
+        object from then on, bypassing levels of detail. release() discards them.
+        
+        """
+        if isinstance(color, basestring):
+            paint = str(color) if color in self.gradients else parse_color(color, strict=True)
+            if paint is None:
+                paint = [0, 0, 0, 0]
+            elif isinstance(paint, str) and paint not in self.gradients:
+                raise KeyError("No gradient with id %r" % paint)
+        else:
+            paint = [int(c) for c in color]
+        if not self.path_lookup[path_id].tri_count:
+            raise ValueError("Path %r has no fill to change" % path_id)
+        renderer = self._editable()
+        svgpath = self.path_lookup[path_id]
+        geometry = renderer.geometry
+        rebuild = isinstance(paint, str) or isinstance(svgpath.fill, str) or isinstance(svgpath.stroke, str)
+        if not isinstance(paint, str):
+            rgba = numpy.array(paint, dtype=numpy.float32) / 255.0
+            tri_colors, line_colors = geometry.shader_colors()
+            tri_colors[svgpath.tri_offset:svgpath.tri_offset + svgpath.tri_count] = rgba
+            if svgpath.outline:
+                line_colors[svgpath.line_offset:svgpath.line_offset + svgpath.line_count] = rgba
+        if svgpath.outline:
+            svgpath.stroke = paint
+        svgpath.fill = paint
+        self._update_path(svgpath, rebuild)
+
+    def set_transform(self, path_id, matrix):
+        """Transforms the path with id `path_id` by `matrix`, a Matrix, an SVG transform 
+        string such as 'rotate(30, 10, 10)' or six values [a, b, c, d, e, f]. The 
+        matrix is applied in the path's own coordinates, on top of the transform it 
+        has in the file, and replaces any matrix previously set. See set_fill().
+        
+        """
+        self._editable()
+        svgpath = self.path_lookup[path_id]
+        if not isinstance(matrix, Matrix):
+            matrix = Matrix(matrix)
+        svgpath.transform = self.geometry.path_lookup[path_id].transform * matrix
+        rebuild = isinstance(svgpath.fill, str) or isinstance(svgpath.stroke, str)
+        self._update_path(svgpath, rebuild)
+
+    def set_visible(self, path_id, visible):
+        """Shows or hides the path with id `path_id`. See set_fill()."""
+        self._editable()
+        svgpath = self.path_lookup[path_id]
+        svgpath.visible = bool(visible)
+        self._update_path(svgpath, False)
+
+    def select_lod(self, scale):
+        """Returns the level of detail to use when drawing at `scale`, or None when 
+        levels of detail are disabled.
+        
+        The effective scale is `scale` multiplied by `lod_bias`, which can be set to 
+        account for any scaling already applied to the modelview matrix.
+        
+        """
+        if not self.lod_scales:
+            return None
+        try:
+            scale = max(abs(scale[0]), abs(scale[1]))
+        except TypeError:
+            scale = abs(scale)
+        scale *= self.lod_bias
+        for lod_scale in self.lod_scales:
+            if lod_scale >= scale:
+                return lod_scale
+        return self.lod_scales[-1]
+
+    def generate_disp_list(self):
+        self.renderer = self.get_renderer(self.select_lod(1.0))
+        self.geometry = self.renderer.geometry
+        self.disp_list = getattr(self.renderer, 'disp_list', None)
+        self.width = self.geometry.width
+        self.height = self.geometry.height
+        self.paths = self.geometry.paths
+        self.path_lookup = self.geometry.path_lookup
+        self.gradients = self.geometry.gradients
+        self.n_tris = self.geometry.n_tris
+        self.n_lines = self.geometry.n_lines
+        self.stats.count(self.geometry, self.renderer)
+        if self.raster:
+            self.sprite = RasterSprite(self, self.atlas, self.raster_tolerance)
+        self.ready = True
+        self.anchor_x = self._anchor_x
+        self.anchor_y = self._anchor_y
+        self._index = None
+        self.stats.finish()
+
+    def spatial_index(self):
+        """Returns the SpatialIndex of the paths as currently drawn, building it 
+        on first use and again after paths are edited."""
+        if self._index is None:
+            geometry = self._edited.geometry if self._edited is not None else self.geometry
+            self._index = SpatialIndex(geometry)
+        return self._index
+
+    def pick(self, px, py, x=0, y=0, angle=0, scale=1):
+        """Returns the ids of the paths under the point (px, py), in paint order, so 
+        the topmost path comes last.
+        
+        `x`, `y`, `angle` and `scale` are those passed to draw(), and the anchor is 
+        taken into account in the same way; (px, py) is in the coordinates draw() 
+        was called in, such as window coordinates under a plain orthographic 
+        projection. Paths without an id are reported as ''.
+        
+        """
+        if not self.ready:
+            return []
+        point = self.to_local(px, py, x, y, angle, scale)
+        if point is None:
+            return []
+        return [svgpath.id for svgpath in self.spatial_index().query(*point)]
+
+    def to_local(self, px, py, x=0, y=0, angle=0, scale=1):
+        """Maps the point (px, py) into the SVG's own coordinates, undoing the 
+        position, angle, scale and anchor which draw() applies. Returns None if 
+        either scale is zero."""
+        px -= x
+        py -= y
+        if angle:
+            a = math.radians(angle)
+            c, s = math.cos(a), math.sin(a)
+            px, py = c * px + s * py, c * py - s * px
+        try:
+            sx, sy = scale[0], scale[1]
+        except TypeError:
+            sx = sy = scale
+        if not sx or not sy:
+            return None
+        return (px / float(sx) + self._a_x, py / float(sy) + self._a_y)
+
+    def _local_viewport(self, viewport, x, y, angle, scale):
+        # The bounding box, in the SVG's coordinates, of a viewport given in the 
+        # coordinates draw() was called in, or of the whole view for 'auto'
+        if viewport == 'auto':
+            return view_bounds()
+        x0, y0, x1, y1 = viewport
+        corners = [self.to_local(cx, cy, x, y, angle, scale)
+                   for cx, cy in ((x0, y0), (x1, y0), (x1, y1), (x0, y1))]
+        if corners[0] is None:
+            return None
+        xs, ys = zip(*corners)
+        return (min(xs), min(ys), max(xs), max(ys))
+
+    def draw(self, x, y, z=0, angle=0, scale=1, viewport=None):
         """Draws the SVG to screen.
         
         :Parameters
@@ -193,446 +509,62 @@ class SVG(object):
             `scale` : float
                 The amount by which the image should be scaled, either as a float, or a tuple 
                 of two floats (xscale, yscale).
+            `viewport` : tuple or str
+                With mode='tiled', the area (min_x, min_y, max_x, max_y) in view, in the same 
+                coordinates as `x` and `y`; only the tiles intersecting it are drawn. 'auto' 
+                derives it from the current projection and modelview matrices. Defaults to 
+                None, which draws everything. Ignored in other modes.
+        
+        Nothing is drawn while the SVG is not `ready`.
         
         """
-        glPushMatrix()
-        glTranslatef(x, y, z)
+        from pyglet import gl
+        if not self.ready:
+            return
+        gl.glPushMatrix()
+        gl.glTranslatef(x, y, z)
         if angle:
-            glRotatef(angle, 0, 0, 1)
+            gl.glRotatef(angle, 0, 0, 1)
         if scale != 1:
             try:
-                glScalef(scale[0], scale[1], 1)
+                gl.glScalef(scale[0], scale[1], 1)
             except TypeError:
-                glScalef(scale, scale, 1)
+                gl.glScalef(scale, scale, 1)
         if self._a_x or self._a_y:  
-            glTranslatef(-self._a_x, -self._a_y, 0)
-        glCallList(self.disp_list)
-        glPopMatrix()
-
-    def render_slowly(self):
-        self.n_tris = 0
-        self.n_lines = 0
-        for svgpath in self.paths:
-            path = svgpath.path
-            stroke = svgpath.stroke
-            tris = svgpath.polygon
-            fill = svgpath.fill
-            transform = svgpath.transform
-            if tris:
-                self.n_tris += len(tris)/3
-                g = None
-                if isinstance(fill, str):
-                    g = self.gradients[fill]
-                    fills = [g.interp(x) for x in tris]
-                else:
-                    fills = [fill for x in tris]
-                
-                glPushMatrix()
-                glMultMatrixf(as_c_matrix(transform.to_mat4()))
-                if g: g.apply_shader(transform)
-                glBegin(GL_TRIANGLES)
-                for vtx, clr in zip(tris, fills):
-                    #vtx = transform(vtx)
-                    if not g: glColor4ub(*clr)
-                    else: glColor4f(1,1,1,1)
-                    glVertex3f(vtx[0], vtx[1], 0)
-                glEnd()
-                glPopMatrix()
-                if g: g.unapply_shader()
-            if path:
-                for loop in path:
-                    self.n_lines += len(loop) - 1
-                    loop_plus = []
-                    for i in xrange(len(loop) - 1):
-                        loop_plus += [loop[i], loop[i+1]]
-                    if isinstance(stroke, str):
-                        g = self.gradients[stroke]
-                        strokes = [g.interp(x) for x in loop_plus]
-                    else:
-                        strokes = [stroke for x in loop_plus]
-                    glPushMatrix()
-                    glMultMatrixf(as_c_matrix(transform.to_mat4()))
-                    glBegin(GL_LINES)
-                    for vtx, clr in zip(loop_plus, strokes):
-                        
-                        #vtx = transform(vtx)
-                        glColor4ub(*clr)
-                        glVertex3f(vtx[0], vtx[1], 0)
-                    glEnd()
-                    glPopMatrix()
-                                     
-    def parse_float(self, txt):
-        if txt.endswith('px'):
-            return float(txt[:-2])
-        else:
-            return float(txt)
-    
-
-    def parse_doc(self):
-        self.paths = []
-        self.width = self.parse_float(self.tree._root.get("width", '0'))
-        self.height = self.parse_float(self.tree._root.get("height", '0'))
-        if self.height:
-            if self.invert_y:
-                self.transform = Matrix([1, 0, 0, -1, 0, self.height])
-            else:
-                self.transform = Matrix([1, 0, 0, 1, 0, 0])
-        else:
-            x, y, w, h = (self.parse_float(x) for x in parse_list(self.tree._root.get("viewBox")))
-            if self.invert_y:
-                self.transform = Matrix([1, 0, 0, -1, 0, 0])
+            gl.glTranslatef(-self._a_x, -self._a_y, 0)
+        if not (self.sprite and self.sprite.draw(scale)):
+            renderer = self.renderer_for(scale)
+            if viewport is not None and isinstance(renderer, TiledRenderer):
+                bounds = self._local_viewport(viewport, x, y, angle, scale)
+                if bounds is not None:
+                    renderer.draw(bounds)
             else:
-                self.transform = Matrix([1, 0, 0, 1, 0, 0])
-            self.height = h
-            self.width = w
-        self.opacity = 1.0
-        for e in self.tree._root.getchildren():
-            try:
-                self.parse_element(e)
-            except Exception, ex:
-                print 'Exception while parsing element', e
-                raise
-            
-    def parse_element(self, e):
-        default = object()
-        self.fill = parse_color(e.get('fill'), default)
-        self.stroke = parse_color(e.get('stroke'), default)
-        oldopacity = self.opacity
-        self.opacity *= float(e.get('opacity', 1))
-        fill_opacity = float(e.get('fill-opacity', 1))
-        stroke_opacity = float(e.get('stroke-opacity', 1))
-        self.path_id = e.get('id', '')
-        self.path_title = e.findtext('{%s}title' % (xmlns,))
-        self.path_description = e.findtext('{%s}desc' % (xmlns,))
+                renderer.draw()
+        gl.glPopMatrix()
 
+    def draw_many(self, xs, ys, angles=0, scales=1):
+        """Draws many copies of the SVG with a single instanced draw call.
         
-        oldtransform = self.transform
-        self.transform = self.transform * Matrix(e.get('transform'))
-        
-        style = e.get('style')
-        if style:
-            sdict = parse_style(style)
-            if 'fill' in sdict:
-                self.fill = parse_color(sdict['fill'])
-            if 'fill-opacity' in sdict:
-                fill_opacity *= float(sdict['fill-opacity'])
-            if 'stroke' in sdict:
-                self.stroke = parse_color(sdict['stroke'])
-            if 'stroke-opacity' in sdict:
-                stroke_opacity *= float(sdict['stroke-opacity'])
-        if self.fill == default:
-            self.fill = [0, 0, 0, 255]
-        if self.stroke == default:
-            self.stroke = [0, 0, 0, 0]  
-        if isinstance(self.stroke, list):
-            self.stroke[3] = int(self.opacity * stroke_opacity * self.stroke[3])
-        if isinstance(self.fill, list):
-            self.fill[3] = int(self.opacity * fill_opacity * self.fill[3])                 
-        if isinstance(self.stroke, list) and self.stroke[3] == 0: self.stroke = self.fill #Stroked edges antialias better
+        Each copy is positioned, rotated and scaled about (anchor_x, anchor_y) as 
+        by draw(). Gradients are rendered with per-vertex colours. Requires the 
+        ARB_instanced_arrays and ARB_draw_instanced OpenGL extensions.
         
-        if e.tag.endswith('path'):
-            pathdata = e.get('d', '')               
-            pathdata = re.findall("([A-Za-z]|-?[0-9]+\.?[0-9]*(?:e-?[0-9]*)?)", pathdata)
-            def pnext():
-                return (float(pathdata.pop(0)), float(pathdata.pop(0)))
-
-            self.new_path()
-            opcode = ''
-            while pathdata:
-                prev_opcode = opcode
-                if pathdata[0] in string.letters:
-                    opcode = pathdata.pop(0)
-                else:
-                    opcode = prev_opcode
-                
-                if opcode == 'M':
-                    self.set_position(*pnext())
-                elif opcode == 'm':
-                    mx, my = pnext()
-                    self.set_position(self.x + mx, self.y + my)
-                elif opcode == 'C':
-                    self.curve_to(*(pnext() + pnext() + pnext()))
-                elif opcode == 'c':
-                    mx = self.x
-                    my = self.y
-                    x1, y1 = pnext()
-                    x2, y2 = pnext()
-                    x, y = pnext()
-                    
-                    self.curve_to(mx + x1, my + y1, mx + x2, my + y2, mx + x, my + y)
-                elif opcode == 'S':
-                    self.curve_to(2 * self.x - self.last_cx, 2 * self.y - self.last_cy, *(pnext() + pnext()))
-                elif opcode == 's':
-                    mx = self.x
-                    my = self.y
-                    x1, y1 = 2 * self.x - self.last_cx, 2 * self.y - self.last_cy
-                    x2, y2 = pnext()
-                    x, y = pnext()
-                    
-                    self.curve_to(x1, y1, mx + x2, my + y2, mx + x, my + y)
-                elif opcode == 'A':
-                    rx, ry = pnext()
-                    phi = float(pathdata.pop(0))
-                    large_arc = int(pathdata.pop(0))
-                    sweep = int(pathdata.pop(0))
-                    x, y = pnext()
-                    self.arc_to(rx, ry, phi, large_arc, sweep, x, y)
-                elif opcode in 'zZ':
-                    self.close_path()
-                elif opcode == 'L':
-                    self.line_to(*pnext())
-                elif opcode == 'l':
-                    x, y = pnext()
-                    self.line_to(self.x + x, self.y + y)
-                elif opcode == 'H':
-                    x = float(pathdata.pop(0))
-                    self.line_to(x, self.y)
-                elif opcode == 'h':
-                    x = float(pathdata.pop(0))
-                    self.line_to(self.x + x, self.y)
-                elif opcode == 'V':
-                    y = float(pathdata.pop(0))
-                    self.line_to(self.x, y)
-                elif opcode == 'v':
-                    y = float(pathdata.pop(0))
-                    self.line_to(self.x, self.y + y)
-                else:
-                    self.warn("Unrecognised opcode: " + opcode)
-            self.end_path()
-        elif e.tag.endswith('rect'):
-            x = float(e.get('x'))
-            y = float(e.get('y'))
-            h = float(e.get('height'))
-            w = float(e.get('width'))
-            self.new_path()
-            self.set_position(x, y)
-            self.line_to(x+w,y)
-            self.line_to(x+w,y+h)
-            self.line_to(x,y+h)
-            self.line_to(x,y)
-            self.end_path()
-        elif e.tag.endswith('polyline') or e.tag.endswith('polygon'):
-            pathdata = e.get('points')
-            pathdata = re.findall("(-?[0-9]+\.?[0-9]*(?:e-?[0-9]*)?)", pathdata)
-            def pnext():
-                return (float(pathdata.pop(0)), float(pathdata.pop(0)))
-            self.new_path()
-            while pathdata:
-                self.line_to(*pnext())
-            if e.tag.endswith('polygon'):
-                self.close_path()
-            self.end_path()
-        elif e.tag.endswith('line'):
-            x1 = float(e.get('x1'))
-            y1 = float(e.get('y1'))
-            x2 = float(e.get('x2'))
-            y2 = float(e.get('y2'))
-            self.new_path()
-            self.set_position(x1, y1)
-            self.line_to(x2, y2)
-            self.end_path()
-        elif e.tag.endswith('circle'):
-            cx = float(e.get('cx'))
-            cy = float(e.get('cy'))
-            r = float(e.get('r'))
-            self.new_path()
-            for i in xrange(self.circle_points):
-                theta = 2 * i * math.pi / self.circle_points
-                self.line_to(cx + r * math.cos(theta), cy + r * math.sin(theta))
-            self.close_path()
-            self.end_path()
-        elif e.tag.endswith('ellipse'):
-            cx = float(e.get('cx'))
-            cy = float(e.get('cy'))
-            rx = float(e.get('rx'))
-            ry = float(e.get('ry'))
-            self.new_path()
-            for i in xrange(self.circle_points):
-                theta = 2 * i * math.pi / self.circle_points
-                self.line_to(cx + rx * math.cos(theta), cy + ry * math.sin(theta))
-            self.close_path()
-            self.end_path()
-        elif e.tag.endswith('linearGradient'):
-            self.gradients[e.get('id')] = LinearGradient(e, self)
-        elif e.tag.endswith('radialGradient'):
-            self.gradients[e.get('id')] = RadialGradient(e, self)
-        for c in e.getchildren():
-            try:
-                self.parse_element(c)
-            except Exception, ex:
-                print 'Exception while parsing element', c
-                raise
-        self.transform = oldtransform
-        self.opacity = oldopacity                        
-
-    def new_path(self):
-        self.x = 0
-        self.y = 0
-        self.close_index = 0
-        self.path = []
-        self.loop = [] 
-        
-    def close_path(self):
-        self.loop.append(self.loop[0][:])
-        self.path.append(self.loop)
-        self.loop = []
-        
-    def set_position(self, x, y):
-        self.x = x
-        self.y = y
-        self.loop.append([x,y])
-    
-    def arc_to(self, rx, ry, phi, large_arc, sweep, x, y):
-        # This function is made out of magical fairy dust
-        # http://www.w3.org/TR/2003/REC-SVG11-20030114/implnote.html#ArcImplementationNotes
-        x1 = self.x
-        y1 = self.y
-        x2 = x
-        y2 = y
-        cp = math.cos(phi)
-        sp = math.sin(phi)
-        dx = .5 * (x1 - x2)
-        dy = .5 * (y1 - y2)
-        x_ = cp * dx + sp * dy
-        y_ = -sp * dx + cp * dy
-        r2 = (((rx * ry)**2 - (rx * y_)**2 - (ry * x_)**2)/
-	      ((rx * y_)**2 + (ry * x_)**2))
-        if r2 < 0: r2 = 0
-        r = math.sqrt(r2)
-        if large_arc == sweep:
-            r = -r
-        cx_ = r * rx * y_ / ry
-        cy_ = -r * ry * x_ / rx
-        cx = cp * cx_ - sp * cy_ + .5 * (x1 + x2)
-        cy = sp * cx_ + cp * cy_ + .5 * (y1 + y2)
-        def angle(u, v):
-            a = math.acos((u[0]*v[0] + u[1]*v[1]) / math.sqrt((u[0]**2 + u[1]**2) * (v[0]**2 + v[1]**2)))
-            sgn = 1 if u[0]*v[1] > u[1]*v[0] else -1
-            return sgn * a
-        
-        psi = angle((1,0), ((x_ - cx_)/rx, (y_ - cy_)/ry))
-        delta = angle(((x_ - cx_)/rx, (y_ - cy_)/ry), 
-                      ((-x_ - cx_)/rx, (-y_ - cy_)/ry))
-        if sweep and delta < 0: delta += math.pi * 2
-        if not sweep and delta > 0: delta -= math.pi * 2
-        n_points = max(int(abs(self.circle_points * delta / (2 * math.pi))), 1)
-        
-        for i in xrange(n_points + 1):
-            theta = psi + i * delta / n_points
-            ct = math.cos(theta)
-            st = math.sin(theta)
-            self.line_to(cp * rx * ct - sp * ry * st + cx,
-                         sp * rx * ct + cp * ry * st + cy)
-
-    def curve_to(self, x1, y1, x2, y2, x, y):
-        if not self.bezier_coefficients:
-            for i in xrange(self.bezier_points+1):
-                t = float(i)/self.bezier_points
-                t0 = (1 - t) ** 3
-                t1 = 3 * t * (1 - t) ** 2
-                t2 = 3 * t ** 2 * (1 - t)
-                t3 = t ** 3
-                self.bezier_coefficients.append([t0, t1, t2, t3])
-        self.last_cx = x2
-        self.last_cy = y2
-        for i, t in enumerate(self.bezier_coefficients):
-            px = t[0] * self.x + t[1] * x1 + t[2] * x2 + t[3] * x
-            py = t[0] * self.y + t[1] * y1 + t[2] * y2 + t[3] * y
-            self.loop.append([px, py])
-
-        self.x, self.y = px, py
-
-    def line_to(self, x, y):
-        self.set_position(x, y)
-
-    def end_path(self):
-        self.path.append(self.loop)
-        if self.path:
-            path = []
-            for orig_loop in self.path:
-                if not orig_loop: continue
-                loop = [orig_loop[0]]
-                for pt in orig_loop:
-                    if (pt[0] - loop[-1][0])**2 + (pt[1] - loop[-1][1])**2 > TOLERANCE:
-                        loop.append(pt)
-                path.append(loop)
-            path_object = SvgPath(path if self.stroke else None, self.stroke,
-                               self.triangulate(path) if self.fill else None, self.fill,
-                               self.transform, self.path_id, self.path_title, self.path_description)
-            self.paths.append(path_object)
-            self.path_lookup[self.path_id] = path_object
-        self.path = []
-
-    def triangulate(self, looplist):
-        tlist = []
-        self.curr_shape = []
-        spareverts = []
-
-        @set_tess_callback(GLU_TESS_VERTEX)
-        def vertexCallback(vertex):
-            vertex = cast(vertex, POINTER(GLdouble))
-            self.curr_shape.append(list(vertex[0:2]))
-
-        @set_tess_callback(GLU_TESS_BEGIN)
-        def beginCallback(which):
-            self.tess_style = which
-
-        @set_tess_callback(GLU_TESS_END)
-        def endCallback():
-            if self.tess_style == GL_TRIANGLE_FAN:
-                c = self.curr_shape.pop(0)
-                p1 = self.curr_shape.pop(0)
-                while self.curr_shape:
-                    p2 = self.curr_shape.pop(0)
-                    tlist.extend([c, p1, p2])
-                    p1 = p2
-            elif self.tess_style == GL_TRIANGLE_STRIP:
-                p1 = self.curr_shape.pop(0)
-                p2 = self.curr_shape.pop(0)
-                while self.curr_shape:
-                    p3 = self.curr_shape.pop(0)
-                    tlist.extend([p1, p2, p3])
-                    p1 = p2
-                    p2 = p3
-            elif self.tess_style == GL_TRIANGLES:
-                tlist.extend(self.curr_shape)
-            else:
-                self.warn("Unrecognised tesselation style: %d" % (self.tess_style,))
-            self.tess_style = None
-            self.curr_shape = []
-
-        @set_tess_callback(GLU_TESS_ERROR)
-        def errorCallback(code):
-            ptr = gluErrorString(code)
-            err = ''
-            idx = 0
-            while ptr[idx]: 
-                err += chr(ptr[idx])
-                idx += 1
-            self.warn("GLU Tesselation Error: " + err)
-
-        @set_tess_callback(GLU_TESS_COMBINE)
-        def combineCallback(coords, vertex_data, weights, dataOut):
-            x, y, z = coords[0:3]
-            data = (GLdouble * 3)(x, y, z)
-            dataOut[0] = cast(pointer(data), POINTER(GLvoid))
-            spareverts.append(data)
+        :Parameters
+            `xs` : sequence of float
+                The x-coordinates at which to draw, as a list, NumPy array or array.array.
+            `ys` : sequence of float
+                The y-coordinates at which to draw.
+            `angles` : float or sequence of float
+                The angles by which the copies should be rotated (in degrees). Defaults to 0.
+            `scales` : float or sequence of float
+                The uniform scale factors of the copies. Defaults to 1. With levels of detail, 
+                the level is chosen from the largest scale.
         
-        data_lists = []
-        for vlist in looplist:
-            d_list = []
-            for x, y in vlist:
-                v_data = (GLdouble * 3)(x, y, 0)
-                d_list.append(v_data)
-            data_lists.append(d_list)
-        gluTessBeginPolygon(tess, None)
-        for d_list in data_lists:    
-            gluTessBeginContour(tess)
-            for v_data in d_list:
-                gluTessVertex(tess, v_data, v_data)
-            gluTessEndContour(tess)
-        gluTessEndPolygon(tess)
-        return tlist       
-
-    def warn(self, message):
-        print "Warning: SVG Parser (%s) - %s" % (self.filename, message)
+        """
+        if not self.ready:
+            return
+        instances = pack_instances(xs, ys, angles, scales)
+        lod_scale = None
+        if self.lod_scales and len(instances):
+            lod_scale = self.select_lod(float(abs(instances[:, 3]).max()))
+        self.get_renderer(lod_scale, 'instanced').draw(instances, self._a_x, self._a_y)
@@ -0,0 +1,154 @@
+"""Triangulation backends for filled paths.
+
+A triangulator turns a list of closed loops of [x, y] points into a flat list
+of [x, y] vertices, three per triangle, covering the area inside the loops
+according to the SVG fill rule ('nonzero' or 'evenodd'). Loops are closed
+implicitly, may overlap or self-intersect, and may describe holes.
+
+Two backends are available from get_triangulator():
+
+    'glu'
+        The GLU tesselator (see glutess.py), called through ctypes. It
+        produces few triangles but needs pyglet's GLU bindings.
+    'python'
+        A sweep-line trapezoidal decomposition written in pure Python. It
+        needs no OpenGL at all, so it can run in any process or thread.
+
+"""
+
+
+class TriangulationError(Exception):
+    """Exception raised when triangulation of a filled area fails. For internal use only."""
+    pass
+
+
+class PythonTriangulator(object):
+    """Triangulates loops by trapezoidal decomposition along a horizontal sweep.
+
+    Vertex heights and edge crossings split the plane into horizontal slabs.
+    Within each slab the active edges are ordered by x, and the fill rule is
+    applied to their accumulated winding to find the inside spans. A span
+    bounded by the same pair of edges in consecutive slabs is merged into one
+    trapezoid, which is emitted as at most two triangles.
+
+    """
+
+    def triangulate(self, looplist, fill_rule='nonzero', warn=None):
+        x0s = []
+        y0s = []
+        y1s = []
+        slopes = []
+        winds = []
+        ys = set()
+        for loop in looplist:
+            n = len(loop)
+            for i in xrange(n):
+                ax, ay = loop[i]
+                bx, by = loop[i + 1 - n]
+                if ay == by:
+                    continue
+                if ay < by:
+                    x0s.append(ax); y0s.append(ay); y1s.append(by)
+                    slopes.append(float(bx - ax) / (by - ay))
+                    winds.append(1)
+                else:
+                    x0s.append(bx); y0s.append(by); y1s.append(ay)
+                    slopes.append(float(ax - bx) / (ay - by))
+                    winds.append(-1)
+                ys.add(ay)
+                ys.add(by)
+        if not x0s:
+            return []
+
+        evenodd = fill_rule == 'evenodd'
+        order = sorted(xrange(len(y0s)), key=y0s.__getitem__)
+        ys = sorted(ys)
+        tlist = []
+
+        def x_at(e, y):
+            return x0s[e] + (y - y0s[e]) * slopes[e]
+
+        def emit(left, right, ya, yb):
+            xla = x_at(left, ya)
+            xra = x_at(right, ya)
+            xlb = x_at(left, yb)
+            xrb = x_at(right, yb)
+            if xra > xla:
+                tlist.extend([[xla, ya], [xra, ya], [xrb, yb]])
+            if xrb > xlb:
+                tlist.extend([[xla, ya], [xrb, yb], [xlb, yb]])
+
+        active = []
+        next_edge = 0
+        open_spans = {}
+        for i in xrange(len(ys) - 1):
+            ya = ys[i]
+            yb = ys[i + 1]
+            active = [e for e in active if y1s[e] > ya]
+            while next_edge < len(order) and y0s[order[next_edge]] <= ya:
+                active.append(order[next_edge])
+                next_edge += 1
+
+            cuts = [ya, yb]
+            if len(active) > 1:
+                by_top = sorted(active, key=lambda e: (x_at(e, ya), x_at(e, yb)))
+                bottoms = [x_at(e, yb) for e in by_top]
+                if any(bottoms[j] < bottoms[j - 1] for j in xrange(1, len(bottoms))):
+                    # Edges cross within the slab; split it at every crossing
+                    tops = [x_at(e, ya) for e in by_top]
+                    for a in xrange(len(by_top)):
+                        for b in xrange(a + 1, len(by_top)):
+                            if bottoms[b] < bottoms[a]:
+                                ea = by_top[a]
+                                eb = by_top[b]
+                                y = ya + (tops[b] - tops[a]) / (slopes[ea] - slopes[eb])
+                                if ya < y < yb:
+                                    cuts.append(y)
+                    cuts = sorted(set(cuts))
+
+            for j in xrange(len(cuts) - 1):
+                ca = cuts[j]
+                ym = (ca + cuts[j + 1]) * .5
+                row = sorted(active, key=lambda e: x_at(e, ym))
+                spans = set()
+                winding = 0
+                left = None
+                for e in row:
+                    was_inside = winding % 2 if evenodd else winding
+                    winding += winds[e]
+                    inside = winding % 2 if evenodd else winding
+                    if inside and not was_inside:
+                        left = e
+                    elif was_inside and not inside:
+                        spans.add((left, e))
+                for span in open_spans.keys():
+                    if span not in spans:
+                        emit(span[0], span[1], open_spans.pop(span), ca)
+                for span in spans:
+                    if span not in open_spans:
+                        open_spans[span] = ca
+        for span, y_start in open_spans.iteritems():
+            emit(span[0], span[1], y_start, ys[-1])
+        return tlist
+
+
+def _glu_triangulator():
+    # Imported here so that the pure Python backend never loads OpenGL
+    from glutess import GLUTriangulator
+    return GLUTriangulator()
+
+triangulators = {'glu': _glu_triangulator,
+                 'python': PythonTriangulator}
+
+_instances = {}
+
+def get_triangulator(name='glu'):
+    """Returns the shared triangulator for the backend `name`, creating it on first use."""
+    if name not in _instances:
+        try:
+            factory = triangulators[name]
+        except KeyError:
+            raise ValueError("Unknown triangulator %r; expected one of %s" %
+                             (name, ', '.join(sorted(triangulators))))
+        _instances[name] = factory()
+    return _instances[name]